@@ -1,66 +1,70 @@
+import argparse
 import os
-import numpy as np
+from datetime import datetime
+from typing import Optional
 
-from src.db_setup import setup_database, insert_decks, export_decks_and_clear_db
-from src.db_processing import init_temp_db, process_single_batch_array_db, export_db_to_csv
+from src.db_setup import generate_decks
+from src.db_processing import export_db_to_csv
+from src.metrics import emit, process_age, stage
+from src.ledger import open_ledger, score_pending
+from src.adaptive import score_until_converged
+from src.fused import generate_and_score
+from src.results_store import save_snapshot
 from src.config import *
-from src.heatmap import * 
+# matplotlib and pandas are only imported by src.heatmap, which is loaded when heatmaps are drawn
 
-def augment_data(n:int):
-    """Runs a simple test of the generation and scoring pipeline."""
+def augment_data(n:int, target: Optional[float] = None, fused: bool = FUSED_PIPELINE, keep_decks: bool = KEEP_DECKS,
+                 heatmaps: bool = True):
+    """
+    Runs a simple test of the generation and scoring pipeline.
+    With a target, batches of n decks are added until every heatmap cell's
+    confidence interval half-width is below it, instead of adding n decks once.
+    With fused, each generated batch is scored straight away (see src.fused);
+    keep_decks=False then skips writing the raw decks.
+    """
     os.makedirs(DATA_UNSCORED_FOLDER, exist_ok=True)
     os.makedirs(DATA_SCORED_FOLDER, exist_ok=True)
     os.makedirs(RESULTS_DIR, exist_ok=True)
-    os.makedirs(FIGURES_DIR, exist_ok=True) 
 
     # Deck generation
-    print("--- STAGE 1: Generating Decks ---")
-    setup_database()
-    insert_decks(n)
-    export_decks_and_clear_db()
-    print(f"✅ Generation complete. {n} decks saved to .npy files.")
+    if target is None and not fused:
+        print("--- STAGE 1: Generating Decks ---")
+        with stage('generate', decks=n):
+            generate_decks(n)
+        print(f"✅ Generation complete. {n} decks saved to .npy files.")
 
     if SCORE_FLAG == True:
         # Scoring
         print("\n--- STAGE 2: Scoring Decks ---")
-        all_unscored_files = [os.path.join(DATA_UNSCORED_FOLDER, f) for f in os.listdir(DATA_UNSCORED_FOLDER) if f.endswith('.npy')]
-        if not all_unscored_files:
+        db_conn = open_ledger(SCORES_DB, PATTERN_LEN, seed_csv_path=RESULTS_CSV)
+        with stage('score') as record:
+            if target is not None:
+                n_scored = score_until_converged(db_conn, PATTERN_LEN, target, batch_size=n, keep_decks=keep_decks)
+            elif fused:
+                n_scored = generate_and_score(db_conn, n, PATTERN_LEN, keep_decks=keep_decks)
+            else:
+                n_scored = score_pending(db_conn, PATTERN_LEN)
+            record['decks'] = n_scored
+        if n_scored == 0 and target is None:
+            db_conn.close()
             print("❌ ERROR: No deck files found to score."); return
-
-        all_decks = np.concatenate([np.load(f) for f in all_unscored_files], axis=0)
-        total_available = len(all_decks)
-        
-        indices = np.random.choice(total_available, size=total_available, replace=False)
-        decks_to_score = all_decks[indices]
-        print(f"Scoring {len(decks_to_score)} unscored decks.")
-
-        scoring_db_path = os.path.join(RESULTS_DIR, 'temp_scoring.db')
-        output_csv_path = os.path.join(RESULTS_DIR, 'scoring_results.csv')
-        
-        if os.path.exists(scoring_db_path):
-            os.remove(scoring_db_path)
-
-        db_conn = init_temp_db(scoring_db_path, PATTERN_LEN, seed_csv_path=output_csv_path)
-        process_single_batch_array_db(decks_to_score, db_conn, PATTERN_LEN)
-        db_conn.commit()
-        export_db_to_csv(db_conn, output_csv_path)
+        print(f"Scored {n_scored} unscored decks (peak RSS {record['peak_rss_mb']:.2f} MB).")
+        with stage('export'):
+            snapshot = save_snapshot(db_conn, n_scored, PATTERN_LEN)
+            if EXPORT_CSV:
+                export_db_to_csv(db_conn, RESULTS_CSV)
         db_conn.close()
-        os.remove(scoring_db_path)
-        
-        print(f"✅ Scoring complete. Results saved to {output_csv_path}")
 
-        print("\n--- STAGE 3: Moving Scored Deck Files ---")
-        for file_path in all_unscored_files:
-            filename = os.path.basename(file_path)
-            destination_path = os.path.join(DATA_SCORED_FOLDER, filename)
-            print(f"  -> Moving {filename} to '{DATA_SCORED_FOLDER}'")
-            os.rename(file_path, destination_path)
-        print("✅ All scored decks moved.")
+        print(f"✅ Scoring complete. Results saved to {snapshot}" + (f" and {RESULTS_CSV}" if EXPORT_CSV else ""))
 
         # Heatmaps
-        print("\n--- STAGE 4: Generating Heatmaps ---")
+        if not heatmaps:
+            print("\nPipeline test finished successfully! 🎉"); return
+        print("\n--- STAGE 3: Generating Heatmaps ---")
         try:
-            generate_heatmaps()
+            with stage('heatmaps'):
+                from src.heatmap import generate_heatmaps
+                generate_heatmaps()
         except FileNotFoundError as e:
             print(f"❌ ERROR: Could not generate heatmaps. {e}")
         except Exception as e:
@@ -69,6 +73,24 @@ def augment_data(n:int):
     print("\nPipeline test finished successfully! 🎉")
         
 
+def main():
+    parser = argparse.ArgumentParser(description="Generate and score decks, then redraw the heatmaps.")
+    parser.add_argument('n', type=int, nargs='?', default=BATCH_SIZE,
+                        help="decks to generate (per batch with --adaptive), default %(default)s")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="keep adding batches until every heatmap cell's confidence interval is below --target")
+    parser.add_argument('--target', type=float, default=CI_TARGET, help="interval half-width to reach, e.g. 0.005 = ±0.5%%")
+    parser.add_argument('--fused', action='store_true', default=FUSED_PIPELINE,
+                        help="score each batch as soon as it is generated")
+    parser.add_argument('--no-decks', action='store_true', help="with --fused or --adaptive, keep only the tallies")
+    parser.add_argument('--no-heatmaps', action='store_true', help="skip the heatmaps (and loading matplotlib)")
+    args = parser.parse_args()
+
+    startup = process_age()
+    print(f"Startup: {startup:.3f} s")
+    emit({'stage': 'startup', 'started_at': datetime.now().isoformat(timespec='milliseconds'), 'wall_s': round(startup, 6)})
+    augment_data(args.n, args.target if args.adaptive else None, args.fused, KEEP_DECKS and not args.no_decks,
+                 heatmaps=not args.no_heatmaps)
+
 if __name__ == "__main__":
-    n = int(input('How many decks would you like to generate? '))
-    augment_data(n)
\ No newline at end of file
+    main()
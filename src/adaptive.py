@@ -0,0 +1,46 @@
+import sqlite3
+from typing import List, Tuple
+import numpy as np
+
+from .config import ADAPTIVE_MAX_DECKS, BATCH_SIZE, CI_TARGET, CI_Z, KEEP_DECKS, PATTERN_LEN, SCORING_WORKERS
+from .fused import generate_and_score
+from .game_logic import pattern_pairs
+from .intervals import INTERVAL_COUNTS, interval_half_widths
+
+def active_pairs(conn: sqlite3.Connection, pattern_len: int = PATTERN_LEN, target: float = CI_TARGET,
+                 z: float = CI_Z) -> List[Tuple[str, str]]:
+    """
+    Pattern pairs whose heatmap cells still have an interval half-width above `target`, in pattern_pairs order.
+    A pair stays active while either it or its mirror is, so both are scored together.
+    """
+    rows = conn.execute(f"SELECT p1, p2, {', '.join(INTERVAL_COUNTS)}, games_count FROM scores").fetchall()
+    columns = ('p1', 'p2', *INTERVAL_COUNTS, 'games_count')
+    table = {col: np.array([row[k] for row in rows]) for k, col in enumerate(columns)}
+    wide_rows = interval_half_widths(table, z) > target
+    wide = set(zip(table['p1'][wide_rows], table['p2'][wide_rows]))
+    return [(p1, p2) for p1, p2 in pattern_pairs(pattern_len) if (p1, p2) in wide or (p2, p1) in wide]
+
+def score_until_converged(conn: sqlite3.Connection, pattern_len: int = PATTERN_LEN, target: float = CI_TARGET,
+                          z: float = CI_Z, batch_size: int = BATCH_SIZE, max_decks: int = ADAPTIVE_MAX_DECKS,
+                          workers: int = SCORING_WORKERS, keep_decks: bool = KEEP_DECKS) -> int:
+    """
+    Generates and scores batches of `batch_size` decks until every heatmap cell has a
+    Wilson interval half-width below `target`, or `max_decks` decks have been generated.
+    Each batch goes through the fused pipeline and is scored only for the pairs that
+    have not converged yet.
+    Returns the number of decks scored.
+    """
+    n_pairs = len(pattern_pairs(pattern_len))
+    generated = n_scored = 0
+    while True:
+        pairs = active_pairs(conn, pattern_len, target, z)
+        print(f"[adaptive] {len(pairs)} of {n_pairs} pairs above ±{target:.2%} after {generated} new decks.")
+        if not pairs:
+            break
+        if generated >= max_decks:
+            print(f"Warning: stopped after {generated} decks with {len(pairs)} pairs still above the target.")
+            break
+        n = min(batch_size, max_decks - generated)
+        n_scored += generate_and_score(conn, n, pattern_len, batch_size, workers, keep_decks, pairs=pairs)
+        generated += n
+    return n_scored
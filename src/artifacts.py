@@ -0,0 +1,67 @@
+import hashlib
+import os
+import re
+import tempfile
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Optional
+import numpy as np
+
+from .config import CACHE_DIR
+from .metrics import count
+
+@lru_cache(maxsize=None)
+def code_version(sources: Iterable[str]) -> str:
+    """
+    Short digest of the source files an artifact is derived from,
+    so editing them invalidates the cached copies.
+    """
+    digest = hashlib.sha256()
+    for path in sources:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+def load_artifact(name: str, key: Dict[str, object], build: Callable[[], Dict[str, np.ndarray]],
+                  sources: Iterable[str], cache_dir: Optional[str] = CACHE_DIR) -> Dict[str, np.ndarray]:
+    """
+    Returns a derived artifact (a dict of arrays), from `cache_dir` when a copy built by the
+    current code exists, otherwise from build(), saving the result for later runs.
+    Files are named by artifact name, key and code version, e.g. blocks_len3_b8_<version>.npz;
+    copies built by older code are removed when a new one is saved.
+    Several processes may build the same artifact at once: each writes its own temporary
+    file and renames it into place, so readers only ever see complete files.
+    cache_dir=None always builds.
+    """
+    if not cache_dir:
+        return build()
+    stem = '_'.join([name, *(f"{field}{value}" for field, value in key.items())])
+    version = code_version(tuple(sources))
+    path = os.path.join(cache_dir, f"{stem}_{version}.npz")
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            artifact = dict(cached)
+        count('bytes_read', os.path.getsize(path))
+        return artifact
+
+    artifact = build()
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=f".{stem}_", suffix='.tmp.npz')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **artifact)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    count('bytes_written', os.path.getsize(path))
+
+    # only finished copies of other code versions are stale; temporary files are never touched
+    finished = re.compile(rf"^{re.escape(stem)}_([0-9a-f]{{12}})\.npz$")
+    for filename in os.listdir(cache_dir):
+        match = finished.match(filename)
+        if match and match.group(1) != version:
+            try:
+                os.remove(os.path.join(cache_dir, filename))
+            except FileNotFoundError:  # removed by another process
+                pass
+    return artifact
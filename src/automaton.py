@@ -0,0 +1,167 @@
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+from . import game_logic
+from .artifacts import load_artifact
+from .config import CACHE_DIR
+from .game_logic import pattern_pairs
+
+@lru_cache(maxsize=None)
+def pair_automaton(p1: str, p2: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    KMP-style automaton for one pattern pair, built once per pair and cached.
+    States are the distinct proper prefixes of both patterns (state 0 is the empty prefix),
+    followed by one terminal state per player. A terminal state moves like the empty prefix,
+    so a walk restarts after every trick without a separate reset.
+    Returns (transitions, owner): transitions[(state << 1) | card] is the next state and
+    owner[state] is 1 or 2 for the terminal states of p1 and p2, 0 otherwise.
+    """
+    if len(p1) != len(p2) or p1 == p2:
+        raise ValueError("pair_automaton needs two distinct patterns of the same length")
+    prefixes = sorted({p[:i] for p in (p1, p2) for i in range(len(p))}, key=lambda s: (len(s), s))
+    index = {s: i for i, s in enumerate(prefixes)}
+    terminal = {p1: len(prefixes), p2: len(prefixes) + 1}
+    n_states = len(prefixes) + 2
+    if n_states > 128:
+        raise ValueError(f"Patterns of length {len(p1)} need too many automaton states.")
+
+    transitions = np.zeros(2 * n_states, dtype=np.uint8)
+    for prefix in prefixes:
+        for card in '01':
+            seq = prefix + card
+            if seq in terminal:
+                nxt = terminal[seq]
+            else:
+                # fall back to the longest suffix that is still a prefix of either pattern
+                while seq not in index:
+                    seq = seq[1:]
+                nxt = index[seq]
+            transitions[(index[prefix] << 1) | int(card)] = nxt
+    for state in terminal.values():
+        transitions[2 * state:2 * state + 2] = transitions[0:2]
+
+    owner = np.zeros(n_states, dtype=np.uint8)
+    owner[terminal[p1]] = 1
+    owner[terminal[p2]] = 2
+    transitions.setflags(write=False)
+    owner.setflags(write=False)
+    return transitions, owner
+
+@lru_cache(maxsize=None)
+def stacked_automata(pairs: Tuple[Tuple[str, str], ...]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The automata of several pattern pairs laid end to end in one table, so a single
+    gather advances every pair at once. States are global: pair k's states start at starts[k]
+    and its transitions already point into its own block.
+    Returns (transitions, owner, starts), indexed like pair_automaton's tables.
+    """
+    blocks = [pair_automaton(p1, p2) for p1, p2 in pairs]
+    sizes = np.array([len(owner) for _, owner in blocks], dtype=np.int64)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    # (state << 1) | card must fit the index dtype too
+    dtype = np.int16 if 2 * sizes.sum() <= np.iinfo(np.int16).max else np.int32
+    transitions = np.concatenate([t.astype(np.int64) + start for (t, _), start in zip(blocks, starts)]).astype(dtype)
+    owner = np.concatenate([owner for _, owner in blocks])
+    starts = starts.astype(dtype)
+    for array in (transitions, owner, starts):
+        array.setflags(write=False)
+    return transitions, owner, starts
+
+# Effect of one block of cards on a game, per (entry state, block value); see block_table
+BLOCK_FIELDS = ('exit', 'p1_tricks', 'p2_tricks', 'p1_cards', 'p2_cards',
+                'p1_first', 'p2_first', 'no_trick', 'pending')
+
+def canonical_pairs(pattern_len: int) -> Tuple[Tuple[str, str], ...]:
+    """
+    Every unordered pattern pair once, as (p1, p2) with p1 < p2, in pattern_pairs order.
+    """
+    return tuple((p1, p2) for p1, p2 in pattern_pairs(pattern_len) if p1 < p2)
+
+def build_block_table(transitions: np.ndarray, owner: np.ndarray, block: int) -> Dict[str, np.ndarray]:
+    """
+    Plays every block of `block` cards from every automaton state at once.
+    Entry (state << block) | value describes the block whose cards are the bits of value,
+    first card in the most significant bit: the exit state, the tricks each player takes,
+    the cards of those tricks counted from the start of the block, whether the first trick
+    is p1's or p2's (it also collects the cards pending before the block), whether no
+    trick is taken at all, and the cards left pending at the end of the block.
+    """
+    n_values = 1 << block
+    state = np.repeat(np.arange(len(owner), dtype=np.int32), n_values)
+    values = np.tile(np.arange(n_values, dtype=np.int32), len(owner))
+    p1_owner = (owner == 1).astype(np.int16)
+    p2_owner = (owner == 2).astype(np.int16)
+    table = {field: np.zeros(len(state), dtype=np.int16) for field in BLOCK_FIELDS[1:]}
+    last_idx = np.zeros(len(state), dtype=np.int16)
+    for j in range(block):
+        state = transitions[(state << 1) | ((values >> (block - 1 - j)) & 1)].astype(np.int32)
+        p1_hit, p2_hit = p1_owner[state], p2_owner[state]
+        hit = p1_hit | p2_hit
+        first = hit & (1 - table['no_trick'])
+        table['p1_first'] += first & p1_hit
+        table['p2_first'] += first & p2_hit
+        gained = (j + 1) - last_idx
+        table['p1_cards'] += gained * p1_hit
+        table['p2_cards'] += gained * p2_hit
+        table['p1_tricks'] += p1_hit
+        table['p2_tricks'] += p2_hit
+        last_idx += gained * hit
+        # used as "a trick was seen" until the loop ends
+        table['no_trick'] |= hit
+    table['no_trick'] = 1 - table['no_trick']
+    table['pending'] = block - last_idx
+    table['exit'] = state
+    return table
+
+@lru_cache(maxsize=None)
+def block_table(pattern_len: int, block: int, cache_dir: Optional[str] = CACHE_DIR) -> Dict[str, np.ndarray]:
+    """
+    Block table (see build_block_table) for the stacked automata of every canonical pair
+    of a pattern length, with 'starts' and 'sizes' locating each pair's states.
+    Built once per (pattern_len, block) and kept in the artifact cache for later runs.
+    """
+    def build() -> Dict[str, np.ndarray]:
+        pairs = canonical_pairs(pattern_len)
+        transitions, owner, starts = stacked_automata(pairs)
+        table = build_block_table(transitions, owner, block)
+        table['starts'] = starts.astype(np.int32)
+        table['sizes'] = np.array([len(pair_automaton(p1, p2)[1]) for p1, p2 in pairs], dtype=np.int32)
+        return table
+
+    table = load_artifact('blocks', {'len': pattern_len, 'b': block}, build, (__file__, game_logic.__file__), cache_dir)
+    for array in table.values():
+        array.setflags(write=False)
+    return table
+
+# a few entries cover the full and remainder block sizes of the current and previous pair subsets;
+# adaptive runs pass a new subset every round, which an unbounded cache would keep forever
+@lru_cache(maxsize=4)
+def stacked_block_tables(pairs: Tuple[Tuple[str, str], ...], block: int) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """
+    Block tables for some canonical pairs laid end to end like stacked_automata,
+    sliced out of the cached table for their pattern length.
+    Returns (table, starts).
+    """
+    pattern_len = len(pairs[0][0])
+    full = block_table(pattern_len, block)
+    index = {pair: k for k, pair in enumerate(canonical_pairs(pattern_len))}
+    parts = {field: [] for field in BLOCK_FIELDS}
+    starts = []
+    start = 0
+    for pair in pairs:
+        k = index[pair]
+        old_start, size = int(full['starts'][k]), int(full['sizes'][k])
+        rows = slice(old_start << block, (old_start + size) << block)
+        for field in BLOCK_FIELDS:
+            parts[field].append(full[field][rows])
+        # exit states move with their pair's block of states
+        parts['exit'][-1] = parts['exit'][-1] + (start - old_start)
+        starts.append(start)
+        start += size
+    table = {field: np.concatenate(arrays) for field, arrays in parts.items()}
+    table['exit'] = table['exit'].astype(np.int32)
+    starts = np.array(starts, dtype=np.int32)
+    for array in (*table.values(), starts):
+        array.setflags(write=False)
+    return table, starts
@@ -0,0 +1,333 @@
+import numpy as np
+from concurrent.futures import Executor
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .game_logic import pattern_pairs
+from .automaton import block_table, stacked_automata, stacked_block_tables
+from .config import BLOCK_SIZE, DECK_LEN, DEDUPE_DECKS, RESOLVER
+from .db_helpers import pack_decks
+
+# Order of the per-game results, matching the return value of play_through_deck
+RESULT_FIELDS = ('p1_cards', 'p1_cards_wins', 'p1_tricks', 'p1_tricks_wins',
+                 'p2_cards', 'p2_cards_wins', 'p2_tricks', 'p2_tricks_wins',
+                 'draw_cards', 'draw_tricks')
+# Counters kept per pattern pair in the scores table
+TALLY_FIELDS = RESULT_FIELDS + ('games_count',)
+# RESULT_FIELDS positions read in this order give the results of the swapped pair (p2, p1)
+MIRROR_ORDER = (4, 5, 6, 7, 0, 1, 2, 3, 8, 9)
+
+def deck_length(decks: np.ndarray, deck_len: int = DECK_LEN) -> int:
+    """
+    Number of cards per deck: the row length of an int8 batch,
+    or `deck_len` for a batch of bit-packed uint64 words.
+    """
+    return decks.shape[1] if decks.ndim == 2 else deck_len
+
+def window_codes(decks: np.ndarray, pattern_len: int, deck_len: int = DECK_LEN) -> np.ndarray:
+    """
+    Return the integer code of every window of `pattern_len` cards in each deck,
+    with the first card of the window as the most significant bit.
+    Accepts (n_decks, deck_len) card arrays or packed uint64 words (see db_helpers.pack_decks),
+    which are matched directly with bit shifts.
+    Shape is (n_decks, deck_len - pattern_len + 1).
+    """
+    decks = np.asarray(decks)
+    if decks.ndim == 1:
+        shifts = np.arange(deck_len - pattern_len, -1, -1, dtype=np.uint64)
+        mask = np.uint64((1 << pattern_len) - 1)
+        return ((decks[:, None] >> shifts) & mask).astype(np.int64)
+    n_windows = decks.shape[1] - pattern_len + 1
+    codes = np.zeros((decks.shape[0], n_windows), dtype=np.int64)
+    for j in range(pattern_len):
+        codes = (codes << 1) | decks[:, j:j + n_windows]
+    return codes
+
+def next_hit_table(codes: np.ndarray, code: int, deck_len: int) -> np.ndarray:
+    """
+    For every deck and start index, return the index of the first window at or
+    after that start whose code equals `code` (deck_len when there is none).
+    Shape is (n_decks, deck_len + 1) so any trick end position can be looked up.
+    """
+    n_decks, n_windows = codes.shape
+    table = np.full((n_decks, deck_len + 1), deck_len, dtype=np.int16)
+    table[:, :n_windows] = np.where(codes == code, np.arange(n_windows, dtype=np.int16), deck_len)
+    return np.minimum.accumulate(table[:, ::-1], axis=1)[:, ::-1]
+
+def game_outcomes(p1_cards: np.ndarray, p2_cards: np.ndarray,
+                  p1_tricks: np.ndarray, p2_tricks: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """
+    Per-deck results in play_through_deck order from the final card and trick counts.
+    """
+    p1_cards, p2_cards, p1_tricks, p2_tricks = (np.asarray(a, dtype=np.int64) for a in (p1_cards, p2_cards, p1_tricks, p2_tricks))
+    p1_cards_wins = (p1_cards > p2_cards).astype(np.int64)
+    p2_cards_wins = (p1_cards < p2_cards).astype(np.int64)
+    draw_cards = (p1_cards == p2_cards).astype(np.int64)
+    p1_tricks_wins = (p1_tricks > p2_tricks).astype(np.int64)
+    p2_tricks_wins = (p1_tricks < p2_tricks).astype(np.int64)
+    draw_tricks = (p1_tricks == p2_tricks).astype(np.int64)
+
+    return p1_cards, p1_cards_wins, p1_tricks, p1_tricks_wins, \
+        p2_cards, p2_cards_wins, p2_tricks, p2_tricks_wins, \
+        draw_cards, draw_tricks
+
+def resolve_tricks(p1_next: np.ndarray, p2_next: np.ndarray, p1_len, p2_len) -> Tuple[np.ndarray, ...]:
+    """
+    Plays every deck of a batch through at once from the next-hit tables of both players.
+    Pattern lengths are scalars or one per row, so rows may also be games of different pairs.
+    The pattern completed first takes the trick; a trick both complete on the same card
+    (only possible for patterns of different lengths, one a suffix of the other) is discarded.
+    Each pass of the loop settles one trick for every deck that still has one left,
+    so the number of passes is bounded by the tricks in a deck, not by the batch size.
+    Returns arrays in the same order as play_through_deck.
+    """
+    n_decks, width = p1_next.shape
+    p1_flat, p2_flat = p1_next.ravel(), p2_next.ravel()
+    p1_len = np.broadcast_to(np.asarray(p1_len, dtype=np.int64), (n_decks,))
+    p2_len = np.broadcast_to(np.asarray(p2_len, dtype=np.int64), (n_decks,))
+    p1_cards = np.zeros(n_decks, dtype=np.int64)
+    p2_cards = np.zeros(n_decks, dtype=np.int64)
+    p1_tricks = np.zeros(n_decks, dtype=np.int64)
+    p2_tricks = np.zeros(n_decks, dtype=np.int64)
+    rows = np.arange(n_decks)
+    last_idx = np.zeros(n_decks, dtype=np.int64)
+    # trick ends; a missing hit (sentinel start deck_len = width - 1) ends past the last card
+    a = p1_next[:, 0] + p1_len
+    b = p2_next[:, 0] + p2_len
+
+    while True:
+        end = np.minimum(a, b)
+        live = end < width
+        if not live.any():
+            break
+        # only decks that just took a trick can have another one
+        rows, last_idx, a, b, end = rows[live], last_idx[live], a[live], b[live], end[live]
+        p1_won, p2_won = a < b, b < a
+        gained = end - last_idx
+
+        p1_cards[rows] += np.where(p1_won, gained, 0)
+        p1_tricks[rows] += p1_won
+        p2_cards[rows] += np.where(p2_won, gained, 0)
+        p2_tricks[rows] += p2_won
+
+        last_idx = end
+        flat_idx = rows * width + last_idx
+        a = p1_flat[flat_idx] + p1_len[rows]
+        b = p2_flat[flat_idx] + p2_len[rows]
+
+    return game_outcomes(p1_cards, p2_cards, p1_tricks, p2_tricks)
+
+def deck_cards(decks: np.ndarray, deck_len: int = DECK_LEN) -> np.ndarray:
+    """
+    Cards of a batch (card rows or packed words) position by position:
+    an int16 array of shape (deck_len, n_decks), so each step reads one contiguous row.
+    """
+    decks = np.asarray(decks)
+    if decks.ndim == 1:
+        shifts = np.arange(deck_len - 1, -1, -1, dtype=np.uint64)
+        return ((decks[None, :] >> shifts[:, None]) & np.uint64(1)).astype(np.int16)
+    return np.ascontiguousarray(decks.T, dtype=np.int16)
+
+def resolve_automaton(decks: np.ndarray, pairs: List[Tuple[str, str]],
+                      deck_len: int = DECK_LEN) -> Dict[Tuple[str, str], Tuple[np.ndarray, ...]]:
+    """
+    Plays every deck of a batch against every pair at once, one card position at a time.
+    Each (pair, deck) game is a walk through the pair's automaton (see automaton.stacked_automata);
+    automaton states, trick and card counters are (n_pairs, n_decks) arrays, so the number of
+    Python-level steps is the deck length whatever the number of decks or pairs.
+    Returns {(p1, p2): per-deck result arrays in play_through_deck order}.
+    """
+    transitions, owner, starts = stacked_automata(tuple(pairs))
+    p1_owner = (owner == 1).astype(np.int16)
+    p2_owner = (owner == 2).astype(np.int16)
+    cards = deck_cards(decks, deck_len).astype(transitions.dtype)
+    n_decks = cards.shape[1]
+
+    state = np.repeat(starts[:, None], n_decks, axis=1)
+    last_idx = np.zeros((len(pairs), n_decks), dtype=np.int16)
+    p1_cards, p2_cards = np.zeros_like(last_idx), np.zeros_like(last_idx)
+    p1_tricks, p2_tricks = np.zeros_like(last_idx), np.zeros_like(last_idx)
+    for t in range(cards.shape[0]):
+        state = transitions[(state << 1) | cards[t]]
+        p1_hit, p2_hit = p1_owner[state], p2_owner[state]
+        gained = (t + 1) - last_idx
+        p1_cards += gained * p1_hit
+        p2_cards += gained * p2_hit
+        p1_tricks += p1_hit
+        p2_tricks += p2_hit
+        last_idx += gained * (p1_hit | p2_hit)
+    return {pair: game_outcomes(p1_cards[k], p2_cards[k], p1_tricks[k], p2_tricks[k])
+            for k, pair in enumerate(pairs)}
+
+def block_values(decks: np.ndarray, start: int, size: int, deck_len: int = DECK_LEN) -> np.ndarray:
+    """
+    Integer value of cards start .. start + size - 1 of each deck, first card in the most
+    significant bit, for card rows or packed words.
+    """
+    decks = np.asarray(decks)
+    if decks.ndim == 1:
+        return ((decks >> np.uint64(deck_len - start - size)) & np.uint64((1 << size) - 1)).astype(np.int32)
+    values = np.zeros(len(decks), dtype=np.int32)
+    for j in range(start, start + size):
+        values = (values << 1) | decks[:, j]
+    return values
+
+def resolve_blocks(decks: np.ndarray, pairs: List[Tuple[str, str]], deck_len: int = DECK_LEN,
+                   block: int = BLOCK_SIZE) -> Dict[Tuple[str, str], Tuple[np.ndarray, ...]]:
+    """
+    Same walk as resolve_automaton, but `block` cards at a time: each step looks up the
+    effect of a whole block (see automaton.block_table), so a 52-card deck takes
+    7 steps with 8-card blocks. Pairs are played in their canonical (p1 < p2) order
+    and mirrored back.
+    Returns {(p1, p2): per-deck result arrays in play_through_deck order}.
+    """
+    canonical = tuple(tuple(sorted(pair)) for pair in pairs)
+    n_decks = len(decks)
+    shape = (len(canonical), n_decks)
+    p1_cards, p2_cards = np.zeros(shape, dtype=np.int16), np.zeros(shape, dtype=np.int16)
+    p1_tricks, p2_tricks = np.zeros(shape, dtype=np.int16), np.zeros(shape, dtype=np.int16)
+    pending = np.zeros(shape, dtype=np.int16)
+    state = None
+    for start in range(0, deck_len, block):
+        size = min(block, deck_len - start)
+        table, starts = stacked_block_tables(canonical, size)
+        if state is None:
+            state = np.repeat(starts[:, None], n_decks, axis=1)
+        idx = (state << size) | block_values(decks, start, size, deck_len)
+        p1_cards += table['p1_cards'][idx] + table['p1_first'][idx] * pending
+        p2_cards += table['p2_cards'][idx] + table['p2_first'][idx] * pending
+        p1_tricks += table['p1_tricks'][idx]
+        p2_tricks += table['p2_tricks'][idx]
+        pending = pending * table['no_trick'][idx] + table['pending'][idx]
+        state = table['exit'][idx]
+
+    results = {}
+    for k, (pair, canonical_pair) in enumerate(zip(pairs, canonical)):
+        outcomes = game_outcomes(p1_cards[k], p2_cards[k], p1_tricks[k], p2_tricks[k])
+        results[pair] = outcomes if pair == canonical_pair else mirror_results(outcomes)
+    return results
+
+def mirror_results(results: Tuple[np.ndarray, ...]) -> Tuple[np.ndarray, ...]:
+    """
+    Results of (p2, p1) from those of (p1, p2): the same tricks are taken by the
+    same patterns, so the players' cards, tricks and wins swap and draws stay put.
+    """
+    return tuple(results[i] for i in MIRROR_ORDER)
+
+def play_through_batch(decks: np.ndarray, p1_bits: List[int], p2_bits: List[int],
+                       deck_len: int = DECK_LEN) -> Tuple[np.ndarray, ...]:
+    """
+    Vectorized play_through_deck: plays one pattern pair through a batch of decks.
+    Returns one array per result, in the same order as play_through_deck.
+    """
+    decks = np.asarray(decks)
+    deck_len = deck_length(decks, deck_len)
+    p1_code = int(''.join(map(str, p1_bits)), 2)
+    p2_code = int(''.join(map(str, p2_bits)), 2)
+    p1_next = next_hit_table(window_codes(decks, len(p1_bits), deck_len), p1_code, deck_len)
+    p2_next = next_hit_table(window_codes(decks, len(p2_bits), deck_len), p2_code, deck_len)
+    return resolve_tricks(p1_next, p2_next, len(p1_bits), len(p2_bits))
+
+def score_batch(decks: np.ndarray, pattern_len: int, deck_len: int = DECK_LEN,
+                pairs: Optional[List[Tuple[str, str]]] = None,
+                resolver: str = RESOLVER) -> Dict[Tuple[str, str], Tuple[np.ndarray, ...]]:
+    """
+    Scores every ordered pattern pair, or only `pairs`, over a batch of decks (card rows or packed words).
+    (p2, p1) is the mirror image of (p1, p2), so each unordered pair is played once, with
+    block lookups ("blocks"), the per-card automaton walk ("automaton") or next-hit tables
+    built once per pattern and shared by all pairs ("next_hit").
+    Returns {(p1, p2): per-deck result arrays in play_through_deck order}.
+    """
+    decks = np.asarray(decks)
+    deck_len = deck_length(decks, deck_len)
+    if pairs is None:
+        pairs = pattern_pairs(pattern_len)
+    seen = set()
+    played = []
+    for p1, p2 in pairs:
+        if (p2, p1) not in seen:
+            played.append((p1, p2))
+        seen.add((p1, p2))
+
+    if resolver == 'blocks':
+        results = resolve_blocks(decks, played, deck_len)
+    elif resolver == 'automaton':
+        results = resolve_automaton(decks, played, deck_len)
+    elif resolver == 'next_hit':
+        codes = window_codes(decks, pattern_len, deck_len)
+        next_hits = {p: next_hit_table(codes, int(p, 2), deck_len) for p in sorted({p for pair in played for p in pair})}
+        results = {(p1, p2): resolve_tricks(next_hits[p1], next_hits[p2], pattern_len, pattern_len) for p1, p2 in played}
+    else:
+        raise ValueError('resolver must be "blocks", "automaton" or "next_hit"')
+    return {(p1, p2): results[(p1, p2)] if (p1, p2) in results else mirror_results(results[(p2, p1)])
+            for p1, p2 in pairs}
+
+def unique_decks(decks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Groups identical decks of a batch (card rows or packed words) by their packed key.
+    Returns (one deck per group, in the batch's own format; number of decks in each group).
+    """
+    decks = np.asarray(decks)
+    if decks.ndim == 1:
+        return np.unique(decks, return_counts=True)
+    if decks.shape[1] > 64:
+        return np.unique(decks, axis=0, return_counts=True)
+    _, first, counts = np.unique(pack_decks(decks), return_index=True, return_counts=True)
+    return decks[first], counts
+
+def tally_batch(decks: np.ndarray, pattern_len: int, deck_len: int = DECK_LEN,
+                pairs: Optional[List[Tuple[str, str]]] = None, dedupe: bool = DEDUPE_DECKS) -> np.ndarray:
+    """
+    Sums the per-deck results of every pattern pair, or only `pairs`, over a batch.
+    With dedupe, identical decks are scored once and their results weighted by how often they occur.
+    Returns an int64 array of shape (n_pairs, len(TALLY_FIELDS)),
+    with rows in pattern_pairs order (or in the order of `pairs`).
+    """
+    n_decks = len(decks)
+    weights = None
+    if dedupe:
+        unique, counts = unique_decks(decks)
+        if len(unique) < n_decks:
+            decks, weights = unique, counts
+    results = score_batch(decks, pattern_len, deck_len, pairs)
+    tallies = np.zeros((len(results), len(TALLY_FIELDS)), dtype=np.int64)
+    rows = {pair: row for row, pair in enumerate(results)}
+    for (p1, p2), res in results.items():
+        if rows.get((p2, p1), len(rows)) < rows[(p1, p2)]:
+            # already summed as the mirror pair
+            tallies[rows[(p1, p2)], :len(RESULT_FIELDS)] = tallies[rows[(p2, p1)], list(MIRROR_ORDER)]
+        elif weights is None:
+            tallies[rows[(p1, p2)], :len(RESULT_FIELDS)] = [r.sum() for r in res]
+        else:
+            tallies[rows[(p1, p2)], :len(RESULT_FIELDS)] = np.stack(res) @ weights
+    tallies[:, -1] = n_decks
+    return tallies
+
+def tally_parallel(decks: np.ndarray, pattern_len: int, workers: int, executor: Optional[Executor] = None,
+                   deck_len: int = DECK_LEN, pairs: Optional[List[Tuple[str, str]]] = None,
+                   tally: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> np.ndarray:
+    """
+    Splits a batch into `workers` contiguous parts, tallies them on the executor
+    and merges the partial tables in part order. Integer counters make the merge
+    exact, so the result is identical to tally_batch on the whole batch.
+    `tally` (a picklable callable of the decks, e.g. a partial of tournament.tally_tournament)
+    replaces tally_batch for other tables; pattern_len and pairs are then unused.
+    """
+    if tally is None:
+        tally = partial(tally_batch, pattern_len=pattern_len, deck_len=deck_len, pairs=pairs)
+        warm_blocks = RESOLVER == 'blocks'
+    else:
+        warm_blocks = False
+    if workers <= 1 or executor is None or len(decks) < workers:
+        return tally(decks)
+    parts = np.array_split(np.asarray(decks), workers)
+    if warm_blocks:
+        # build (or load) the block tables here once, so the workers only ever read the cached copy
+        n_cards = deck_length(parts[0], deck_len)
+        for start in range(0, n_cards, BLOCK_SIZE):
+            block_table(pattern_len, min(BLOCK_SIZE, n_cards - start))
+    partials = list(executor.map(tally, parts))
+    tallies = partials[0].copy()
+    for partial_tally in partials[1:]:
+        tallies += partial_tally
+    return tallies
@@ -0,0 +1,147 @@
+"""
+Benchmarks each pipeline stage at several deck counts.
+
+    python -m src.bench --counts 10000 100000 1000000 --out bench_results.json
+
+Everything runs in a temporary directory, so real decks, scores and figures are untouched.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from .config import BATCH_SIZE, DECK_STORAGE, PATTERN_LEN, SCORE_CHUNK_SIZE, SCORING_WORKERS
+from .db_generation import generate_batches
+from .db_helpers import prefetch_deck_chunks, save_decks
+from .db_processing import export_db_to_csv
+from .ledger import open_ledger, register_files, score_pending
+from .metrics import stage
+from .results_store import save_snapshot
+
+def time_stage(name: str, fun: Callable[[], int]) -> Dict[str, float]:
+    """
+    Runs one stage under metrics.stage and returns its record.
+    `fun` returns the number of decks it handled (0 when throughput does not apply).
+    """
+    with stage(name, metrics_file=None) as record:
+        record['decks'] = fun()
+    return record
+
+def bench_pipeline(n_decks: int, workers: int = SCORING_WORKERS, heatmaps: bool = True) -> Dict[str, Dict[str, float]]:
+    """
+    Times generation, loading, scoring, export and heatmap stages for n_decks decks.
+    """
+    stages = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        paths: List[str] = []
+        db_path = os.path.join(tmp, 'scores.db')
+        csv_path = os.path.join(tmp, 'scoring_results.csv')
+        unscored, scored = os.path.join(tmp, 'unscored'), os.path.join(tmp, 'scored')
+        os.makedirs(unscored)
+        os.makedirs(scored)
+
+        def generate() -> int:
+            # each file is recorded in the ledger as soon as it is written, as in generate_decks
+            conn = open_ledger(db_path, PATTERN_LEN, seed_csv_path=csv_path)
+            for seed, decks in generate_batches(1, n_decks, BATCH_SIZE):
+                path = os.path.join(unscored, f"decks_{len(decks)}_seed{seed}.npy")
+                save_decks(path, decks)
+                register_files(conn, [path])
+                paths.append(path)
+            conn.close()
+            return n_decks
+
+        def load() -> int:
+            # the reader score_pending uses, which copies each chunk out of the memory-mapped file
+            return sum(len(chunk) for _, chunk in prefetch_deck_chunks([(path, 0) for path in paths], SCORE_CHUNK_SIZE))
+
+        def score() -> int:
+            # Stage 2 as main.augment_data runs it: ledger, prefetch threads, checkpoint commits and file moves
+            conn = open_ledger(db_path, PATTERN_LEN, seed_csv_path=csv_path)
+            n = score_pending(conn, PATTERN_LEN, SCORE_CHUNK_SIZE, workers, scored_folder=scored, unscored_folder=unscored)
+            conn.close()
+            return n
+
+        def export() -> int:
+            conn = sqlite3.connect(db_path)
+            save_snapshot(conn, n_decks, PATTERN_LEN, snapshot_dir=tmp)
+            export_db_to_csv(conn, csv_path)
+            conn.close()
+            return 0
+
+        def heatmap() -> int:
+            from .heatmap import generate_heatmaps
+            generate_heatmaps(out_dir=tmp, snapshot_dir=tmp)
+            return 0
+
+        stages['generate'] = time_stage('generate', generate)
+        stages['load'] = time_stage('load', load)
+        stages['score'] = time_stage('score', score)
+        stages['export'] = time_stage('export', export)
+        if heatmaps:
+            stages['heatmap'] = time_stage('heatmap', heatmap)
+    return stages
+
+def cold_start(repeats: int = 3) -> float:
+    """
+    Best-of-`repeats` wall time of `python main.py --help` in a fresh interpreter:
+    interpreter start-up plus every import on the generation and scoring path.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'main.py', '--help'], cwd=root, capture_output=True, check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def git_commit() -> str:
+    """Returns the current git commit hash, or '' outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the generation, scoring and heatmap stages.")
+    parser.add_argument('--counts', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help="deck counts to benchmark")
+    parser.add_argument('--workers', type=int, default=SCORING_WORKERS, help="scoring processes")
+    parser.add_argument('--no-heatmaps', action='store_true', help="skip the heatmap stage")
+    parser.add_argument('--out', default='bench_results.json', help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'pattern_len': PATTERN_LEN,
+        'deck_storage': DECK_STORAGE,
+        'workers': args.workers,
+        'cold_start_s': round(cold_start(), 4),
+        'runs': [],
+    }
+    print(f"[bench] cold start (python main.py --help): {report['cold_start_s']:.3f} s")
+    for n_decks in args.counts:
+        print(f"[bench] {n_decks} decks ...")
+        stages = bench_pipeline(n_decks, args.workers, heatmaps=not args.no_heatmaps)
+        for name, stats in stages.items():
+            rate = f"{stats['decks_per_sec']:>12,.0f} decks/s" if stats['decks_per_sec'] else " " * 20
+            print(f"  {name:<8} {stats['wall_s']:>9.3f} s {rate}  peak RSS {stats['peak_rss_mb']:.1f} MB")
+        report['runs'].append({'n_decks': n_decks, 'stages': stages})
+
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"[bench] Results written to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -2,23 +2,63 @@
 
 # Card settings
 CARDS_PER_COLOR = 26
-DECK_LEN = 52
 DEFAULT_COMPOSITION = {"R": CARDS_PER_COLOR, "B": CARDS_PER_COLOR}
+DECK_LEN = sum(DEFAULT_COMPOSITION.values())
+
+# Player pattern length 
+PATTERN_LEN = 3  
 
 # Generation settings
 BATCH_SIZE = 10000
+DECK_STORAGE = "packed"  # "packed" (one uint64 per deck) or "int8" (one byte per card)
+GENERATION_WORKERS = 1  # processes generating batches of decks, each from its seed's own stream (>1 runs batches in parallel)
+
+# Decks of another composition, and results for another pattern length, are kept apart from the defaults
+COMPOSITION_TAG = "" if DEFAULT_COMPOSITION == {"R": 26, "B": 26} else f"_{DEFAULT_COMPOSITION['R']}R{DEFAULT_COMPOSITION['B']}B"
+RESULTS_TAG = COMPOSITION_TAG + ("" if PATTERN_LEN == 3 else f"_len{PATTERN_LEN}")
 
 # File paths
-DATA_UNSCORED_FOLDER = "./data/decks/unscored"
-DATA_SCORED_FOLDER = "./data/decks/scored"
+DATA_UNSCORED_FOLDER = f"./data/decks/unscored{COMPOSITION_TAG}"
+DATA_SCORED_FOLDER = f"./data/decks/scored{COMPOSITION_TAG}"
 DB_PATH = "decks.db"
 FIGURES_DIR = "./figures"
 RESULTS_DIR = "./data/results/"
-RESULTS_CSV = "./data/results/scoring_results.csv"
+RESULTS_CSV = f"./data/results/scoring_results{RESULTS_TAG}.csv"
+SNAPSHOT_DIR = f"./data/results/snapshots{RESULTS_TAG}"  # one (p1, p2, counter) tensor per run, for the heatmaps and trends
+SCORES_DB = f"./data/results/scores{RESULTS_TAG}.db"  # cumulative scores and the ledger of scored deck files
+CACHE_DIR = "./data/cache"  # precomputed lookup tables, rebuilt on demand when missing
+METRICS_FILE = "./data/results/metrics.jsonl"  # per-stage metrics, one JSON record per line (None to disable)
 
-# Player pattern length 
-PATTERN_LEN = 3  
+# Scoring settings
+FLUSH_EVERY = None  # decks scored between writes to the scores table, None = once per batch
+SCORE_CHUNK_SIZE = BATCH_SIZE  # decks read from disk and scored at a time when streaming deck files
+PREFETCH_CHUNKS = 2  # chunks read ahead on background threads while the current one is scored (0 = no prefetch)
+SCORING_WORKERS = 1  # processes used for scoring, >1 splits each batch across a process pool
+CHECKPOINT_SECONDS = 5.0  # commit scoring progress at least this often (None = only by deck count)
+CHECKPOINT_DECKS = None  # ... or every this many decks (None = only by time)
+# "blocks" (one table lookup per BLOCK_SIZE cards, all pairs at once), "automaton" (one step per card)
+# or "next_hit" (one step per trick, pair by pair); blocks is the fastest for pattern lengths 3 to 5
+RESOLVER = "blocks"
+DEDUPE_DECKS = True  # score identical decks of a batch once, weighted by their count (pays off for small decks)
+BLOCK_SIZE = 8  # cards per block lookup; tables grow as 2**BLOCK_SIZE per automaton state
+FUSED_PIPELINE = False  # score each batch as soon as it is generated, instead of generating files and then scoring them
+KEEP_DECKS = True  # in the fused pipeline, also save the raw decks (to the scored folder); False keeps only the tallies
+FUSED_QUEUE_SIZE = 4  # batches the generator may run ahead of the scorer in the fused pipeline
+
+# Tournaments (any list of patterns, of any lengths)
+TOURNAMENT_TABLE = "tournament"  # table of the scores database holding tournament counters per ordered pair
+TOURNAMENT_CELLS = 1 << 20  # (pair, deck) games played per vectorized step; bounds the memory of a step
+
+# Results
+EXPORT_CSV = True  # also write RESULTS_CSV after each run; the snapshots alone are enough for the heatmaps
+
+# Heatmaps
+HEATMAP_ANNOTATE_MAX = 16  # patterns per axis up to which cells are labelled "win(draw)" (PATTERN_LEN <= 4)
+
+# Adaptive sampling
+CI_Z = 1.96  # z-score of the Wilson intervals written to the results CSV (1.96 = 95%)
+CI_TARGET = 0.005  # adaptive mode stops once every heatmap cell's interval half-width is below this
+ADAPTIVE_MAX_DECKS = 10_000_000  # adaptive mode gives up after generating this many decks
 
 # Test Pipeline
 SCORE_FLAG = True
-
@@ -1,16 +1,20 @@
 import os
 import collections
-import random
 import re
-from typing import Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
 
-from .config import DEFAULT_COMPOSITION, DATA_SCORED_FOLDER, DATA_UNSCORED_FOLDER
+from .config import DEFAULT_COMPOSITION, DATA_SCORED_FOLDER, DATA_UNSCORED_FOLDER, GENERATION_WORKERS, SCORES_DB
+from .db_helpers import bounded_map
+from .ledger import ledger_max_seed
 
 class Deck:
     """
     Class representing a deck of cards, refined for database interaction.
     """
-    def __init__(self, composition: Optional[Dict[str, int]] = None, shuffle: bool = True):
+    def __init__(self, composition: Optional[Dict[str, int]] = None, shuffle: bool = True,
+                 rng: Optional[np.random.Generator] = None):
         if composition is None:
             self._composition = DEFAULT_COMPOSITION.copy()
         else:
@@ -21,7 +25,8 @@ class Deck:
             card_list.extend([card_type] * count)
         
         if shuffle:
-            random.shuffle(card_list)
+            # an explicit generator (see deck_rng) makes the deck reproducible without global state
+            (rng if rng is not None else np.random.default_rng()).shuffle(card_list)
         
         self.cards = collections.deque(card_list)
 
@@ -40,11 +45,59 @@ class Deck:
     def __str__(self) -> str:
         return f"Deck with {len(self)} cards. Top card: {self.cards[0] if self.cards else 'N/A'}"
 
-def get_next_seed(data_unscored=DATA_UNSCORED_FOLDER, data_scored=DATA_SCORED_FOLDER) -> int:
+def deck_rng(seed: int) -> np.random.Generator:
     """
-    Finds the last used seed by searching for the highest seed number
+    The random stream of one seed: a Generator on its own SeedSequence, with no global state,
+    so a seed gives the same decks in any process and streams of different seeds are independent.
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed))
+
+def generate_deck_batch(seed: int, n: int, composition: Optional[Dict[str, int]] = None) -> np.ndarray:
+    """
+    Generates n shuffled decks as an (n, deck_len) int8 array (R = 1, B = 0)
+    from the seed's own stream, so the same seed always
+    regenerates the same batch.
+    """
+    if composition is None:
+        composition = DEFAULT_COMPOSITION
+    base = np.array([1 if card_type == 'R' else 0 for card_type, count in composition.items() for _ in range(count)], dtype=np.int8)
+    return deck_rng(seed).permuted(np.tile(base, (n, 1)), axis=1)
+
+def generate_batches(first_seed: int, n: int, batch_size: int,
+                     workers: int = GENERATION_WORKERS) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Yields (seed, decks) for n decks in batches of up to batch_size, one seed per batch from first_seed.
+    With workers > 1 the batches are generated on a process pool, at most 2 * workers ahead
+    of the consumer; each batch depends only on its seed, so the decks are bit-identical
+    whatever the number of workers.
+    """
+    batches = [(seed, min(batch_size, n - start)) for seed, start in enumerate(range(0, n, batch_size), start=first_seed)]
+    if workers <= 1:
+        for seed, size in batches:
+            yield seed, generate_deck_batch(seed, size)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = bounded_map(pool, _generate, batches, 2 * workers)
+        try:
+            for (seed, _), decks in zip(batches, results):
+                yield seed, decks
+        finally:
+            results.close()
+
+def _generate(batch: Tuple[int, int]) -> np.ndarray:
+    """generate_deck_batch for a (seed, n) pair, for bounded_map."""
+    return generate_deck_batch(*batch)
+
+def get_next_seed(data_unscored=DATA_UNSCORED_FOLDER, data_scored=DATA_SCORED_FOLDER, ledger_path=SCORES_DB) -> int:
+    """
+    Returns the seed after the highest one recorded in the ledger.
+    Before a ledger exists, falls back to searching for the highest seed number
     in both the unscored and scored data folders.
     """
+    ledger_seed = ledger_max_seed(ledger_path)
+    if ledger_seed is not None:
+        return ledger_seed + 1
+
     filename_pattern = re.compile(r'^decks_\d+_seed(\d+)\.npy$')
     last_seed = 0
     folders_to_check = [data_unscored, data_scored]
@@ -1,28 +1,23 @@
 import os
 import numpy as np
-from datetime import datetime as dt
-from typing import List, Callable
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import wraps
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Tuple
 import re
 
-# debugger from class 
-
-SHOW_ARGS = True  
+from .config import DECK_LEN, DECK_STORAGE, PREFETCH_CHUNKS
+from .metrics import count, stage
 
 def debugger(fun: Callable) -> Callable:
+    """
+    Records each call of `fun` as an instrumented stage (see metrics.stage).
+    """
+    @wraps(fun)
     def _wrapper(*args, **kwargs):
-        print(f'{fun.__name__} called')
-        if SHOW_ARGS:
-            print(f'args: {args}')
-            print(f'kwargs: {kwargs}')
-
-        t0 = dt.now()
-        # always write this line like this 
-
-        results = fun(*args, **kwargs)
-        print(f'ran for {dt.now()-t0} sec(s)')
-
-        # do not modify the return signature 
-        return results
+        with stage(fun.__name__):
+            return fun(*args, **kwargs)
     return _wrapper
 
 def decks_loaded(data_folder='./data/decks/') -> int: 
@@ -42,6 +37,94 @@ def decks_loaded(data_folder='./data/decks/') -> int:
             total_decks += deck_count_in_file
     return total_decks
 
+def pack_decks(decks: np.ndarray) -> np.ndarray:
+    """
+    Packs an (n, deck_len) array of 0/1 cards into one uint64 word per deck,
+    first card in the most significant of the deck_len low bits.
+    """
+    decks = np.asarray(decks)
+    deck_len = decks.shape[1]
+    if deck_len > 64:
+        raise ValueError(f"Cannot pack decks of {deck_len} cards into a uint64 word.")
+    weights = np.uint64(1) << np.arange(deck_len - 1, -1, -1, dtype=np.uint64)
+    return (decks.astype(np.uint64) * weights).sum(axis=1, dtype=np.uint64)
+
+def unpack_decks(words: np.ndarray, deck_len: int = DECK_LEN) -> np.ndarray:
+    """
+    Inverse of pack_decks: returns an (n, deck_len) int8 array of cards.
+    """
+    shifts = np.arange(deck_len - 1, -1, -1, dtype=np.uint64)
+    return ((np.asarray(words, dtype=np.uint64)[:, None] >> shifts) & np.uint64(1)).astype(np.int8)
+
+def save_decks(path: str, decks: np.ndarray, storage: str = DECK_STORAGE) -> None:
+    """
+    Saves a batch of decks as .npy, bit-packed when storage is 'packed'.
+    """
+    if storage == 'packed':
+        decks = pack_decks(decks)
+    elif storage != 'int8':
+        raise ValueError('storage must be either "packed" or "int8"')
+    np.save(path, decks)
+    count('bytes_written', os.path.getsize(path))
+
+def load_decks(path: str, deck_len: int = DECK_LEN) -> np.ndarray:
+    """
+    Loads a deck file in either storage format as an (n, deck_len) int8 array.
+    """
+    decks = np.load(path)
+    count('bytes_read', decks.nbytes)
+    return unpack_decks(decks, deck_len) if decks.ndim == 1 else decks
+
+def bounded_map(pool: Executor, fun: Callable, items: Iterable, depth: int) -> Iterator:
+    """
+    Yields fun(item) for each item in order, computed on `pool` at most `depth` items
+    ahead of the consumer. Work not yet started is cancelled when the consumer stops early.
+    """
+    items = iter(items)
+    ahead = deque(pool.submit(fun, item) for item in islice(items, depth))
+    try:
+        while ahead:
+            result = ahead.popleft().result()
+            for item in islice(items, 1):
+                ahead.append(pool.submit(fun, item))
+            yield result
+    finally:
+        for future in ahead:
+            future.cancel()
+
+def _read_chunk(item: Tuple[int, np.ndarray, int, int]) -> Tuple[int, np.ndarray]:
+    """Copies rows start .. start + size - 1 of a memory-mapped file into RAM."""
+    k, decks, start, size = item
+    return k, np.array(decks[start:start + size])
+
+def prefetch_deck_chunks(files: Iterable[Tuple[str, int]], chunk_size: int,
+                         depth: int = PREFETCH_CHUNKS) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Streams decks from (path, skip) .npy files in chunks of at most `chunk_size` rows, leaving out
+    the first `skip` decks of each file (already scored before a restart), and yields
+    (file index, chunk), while background threads already read the next `depth` chunks, so disk
+    or network reads overlap scoring. Files are memory-mapped, so at most `depth` chunks are held
+    in RAM ahead of the consumer; depth 0 reads inline.
+    Chunks keep their storage format (packed words or int8 rows); the scorer accepts both.
+    """
+    def slices():
+        for k, (path, skip) in enumerate(files):
+            decks = np.load(path, mmap_mode='r')
+            for start in range(skip, len(decks), chunk_size):
+                yield k, decks, start, chunk_size
+
+    def counted(chunks: Iterator[Tuple[int, np.ndarray]]) -> Iterator[Tuple[int, np.ndarray]]:
+        # counted on the consumer's thread: metrics.count is not safe to call from the pool threads
+        for k, chunk in chunks:
+            count('bytes_read', chunk.nbytes)
+            yield k, chunk
+
+    if depth <= 0:
+        yield from counted(map(_read_chunk, slices()))
+        return
+    with ThreadPoolExecutor(max_workers=depth) as pool:
+        yield from counted(bounded_map(pool, _read_chunk, slices(), depth))
+
 def string_to_binary(seq: str) -> List[int]:
     '''
     Convert a string like 'RRR' to binary [1, 1, 1]
@@ -1,9 +1,24 @@
+import csv
 import os
+import time
 import numpy as np
-import pandas as pd
 import sqlite3
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple
 # Import shared logic from the new file
-from .game_logic import all_patterns, str_to_bits, play_through_deck
+from .game_logic import all_patterns, pattern_pairs
+from .batch_logic import TALLY_FIELDS, tally_parallel
+from .config import CHECKPOINT_DECKS, CHECKPOINT_SECONDS, CI_Z, FLUSH_EVERY, SCORING_WORKERS
+from .intervals import add_intervals
+from .metrics import count
+
+def create_scores_table(db_conn: sqlite3.Connection, table: str = 'scores') -> None:
+    """
+    Creates a table of counters per ordered pattern pair (patterns of any length), unless it exists.
+    """
+    counters = ", ".join(f"{col} INTEGER" for col in TALLY_FIELDS)
+    db_conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (p1 TEXT, p2 TEXT, {counters}, PRIMARY KEY (p1, p2))")
+    count('sql_statements')
 
 def init_temp_db(db_path: str, pattern_len: int, seed_csv_path: str) -> sqlite3.Connection:
     """
@@ -11,43 +26,128 @@ def init_temp_db(db_path: str, pattern_len: int, seed_csv_path: str) -> sqlite3.
     """
 
     conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    create_scores_table(conn)
     if os.path.exists(seed_csv_path):
-        pd.read_csv(seed_csv_path, dtype={'p1': str, 'p2': str}).to_sql('scores', conn, if_exists='replace', index=False)
+        # interval columns are derived on export and are not stored
+        with open(seed_csv_path, newline='') as f:
+            rows = [(row['p1'], row['p2'], *(int(row[col]) for col in TALLY_FIELDS)) for row in csv.DictReader(f)]
+        count('bytes_read', os.path.getsize(seed_csv_path))
     else:
-        cursor = conn.cursor()
-        cursor.execute("CREATE TABLE scores (p1 TEXT, p2 TEXT, p1_cards INTEGER, p1_cards_wins INTEGER, p1_tricks INTEGER, p1_tricks_wins INTEGER, p2_cards INTEGER, p2_cards_wins INTEGER, p2_tricks INTEGER, p2_tricks_wins INTEGER, draw_cards INTEGER, draw_tricks INTEGER, games_count INTEGER, PRIMARY KEY (p1, p2))")
         patterns = all_patterns(pattern_len)
         rows = [(p1, p2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0) for p1 in patterns for p2 in patterns if p1 != p2]
-        cursor.executemany("INSERT INTO scores VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)", rows)
-        conn.commit()
+    cursor.executemany("INSERT INTO scores VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+    conn.commit()
+    count('sql_statements', 1 + len(rows))
     return conn
 
-def update_aggregate_db(db_conn, p1: str, p2: str, p1_c, p1_cw, p1_t, p1_tw, p2_c, p2_cw, p2_t, p2_tw, d_c, d_t):
+def flush_tallies(db_conn: sqlite3.Connection, pairs: List[Tuple[str, str]], tallies: np.ndarray,
+                  table: str = 'scores'):
+    """
+    Adds a block of per-pair counters to the scores table (or `table`) with a single executemany.
+    Raises ValueError if some pairs have no row, e.g. a table built for another pattern length.
+    """
+
+    assignments = ", ".join(f"{col}={col}+?" for col in TALLY_FIELDS)
+    query = f"UPDATE {table} SET {assignments} WHERE p1=? AND p2=?"
+    cursor = db_conn.executemany(query, [(*map(int, row), p1, p2) for (p1, p2), row in zip(pairs, tallies)])
+    count('sql_statements', len(pairs))
+    if cursor.rowcount != len(pairs):
+        raise ValueError(f"Table {table} has {cursor.rowcount} of the {len(pairs)} pattern pairs being scored.")
+
+def export_db_to_csv(db_conn, out_csv_path: str, z: float = CI_Z, table: str = 'scores'):
     """
-    Updates the database.
+    Exports the scores table (or `table`) to CSV file, with Wilson intervals next to the win counters the heatmaps use.
     """
 
-    query = "UPDATE scores SET p1_cards=p1_cards+?, p1_cards_wins=p1_cards_wins+?, p1_tricks=p1_tricks+?, p1_tricks_wins=p1_tricks_wins+?, p2_cards=p2_cards+?, p2_cards_wins=p2_cards_wins+?, p2_tricks=p2_tricks+?, p2_tricks_wins=p2_tricks_wins+?, draw_cards=draw_cards+?, draw_tricks=draw_tricks+?, games_count=games_count+1 WHERE p1=? AND p2=?"
-    db_conn.cursor().execute(query, (p1_c, p1_cw, p1_t, p1_tw, p2_c, p2_cw, p2_t, p2_tw, d_c, d_t, p1, p2))
+    cursor = db_conn.execute(f"SELECT * FROM {table} ORDER BY p1, p2")
+    columns, rows = add_intervals([d[0] for d in cursor.description], cursor.fetchall(), z)
+    with open(out_csv_path, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(columns)
+        writer.writerows(rows)
+    count('sql_statements')
+    count('bytes_written', os.path.getsize(out_csv_path))
 
-def export_db_to_csv(db_conn, out_csv_path: str):
+class Checkpointer:
     """
-    Exports to CSV file.
+    Commits a connection once `every_decks` decks or `every_seconds` seconds have gone by
+    since the last commit, whichever comes first (None disables either limit).
+    Whatever the caller wrote alongside the counters, such as how far a file has been
+    scored, is committed in the same transaction, so a restart resumes exactly there.
     """
+    def __init__(self, db_conn: sqlite3.Connection, every_decks: Optional[int] = CHECKPOINT_DECKS,
+                 every_seconds: Optional[float] = CHECKPOINT_SECONDS):
+        self.db_conn = db_conn
+        self.every_decks = every_decks
+        self.every_seconds = every_seconds
+        self.on_commit: List[Callable[[], None]] = []
+        self._reset()
 
-    pd.read_sql_query("SELECT * FROM scores ORDER BY p1, p2", db_conn).to_csv(out_csv_path, index=False)
+    def _reset(self):
+        self.pending_decks = 0
+        self.last_commit = time.monotonic()
 
-def process_single_batch_array_db(batch_array: np.ndarray, db_conn: sqlite3.Connection, pattern_len: int):
+    def advance(self, n_decks: int) -> bool:
+        """
+        Counts decks written since the last commit and commits if a limit is reached.
+        Returns whether it committed.
+        """
+        self.pending_decks += n_decks
+        if (self.every_decks is not None and self.pending_decks >= self.every_decks) or \
+                (self.every_seconds is not None and time.monotonic() - self.last_commit >= self.every_seconds):
+            self.commit()
+            return True
+        return False
+
+    def commit(self):
+        """
+        Commits now, then runs the actions that had to wait for it.
+        """
+        self.db_conn.commit()
+        count('checkpoints')
+        self._reset()
+        actions, self.on_commit = self.on_commit, []
+        for action in actions:
+            action()
+
+def process_deck_stream(chunks: Iterable[np.ndarray], db_conn: sqlite3.Connection, pattern_len: int,
+                        workers: int = SCORING_WORKERS, executor: Optional[Executor] = None,
+                        pairs: Optional[List[Tuple[str, str]]] = None,
+                        on_chunk: Optional[Callable[[int], None]] = None) -> int:
+    """
+    Scores a stream of deck chunks for every pattern pair (or only `pairs`),
+    flushing the counters once per chunk and then calling on_chunk(decks in the chunk).
+    With workers > 1 each chunk is scored on a process pool (the given executor,
+    or one owned by this call) and only the parent process writes the merged counters.
+    Returns the number of decks scored.
+    """
+
+    if pairs is None:
+        pairs = pattern_pairs(pattern_len)
+    own_executor = executor is None and workers > 1
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    n_scored = 0
+    try:
+        for chunk in chunks:
+            flush_tallies(db_conn, pairs, tally_parallel(chunk, pattern_len, workers, executor, pairs=pairs))
+            n_scored += len(chunk)
+            if on_chunk is not None:
+                on_chunk(len(chunk))
+    finally:
+        if own_executor:
+            executor.shutdown()
+    return n_scored
+
+def process_single_batch_array_db(batch_array: np.ndarray, db_conn: sqlite3.Connection, pattern_len: int,
+                                   flush_every: Optional[int] = FLUSH_EVERY, workers: int = SCORING_WORKERS):
     """
     Processes a numpy array of decks, updating database.
+    Counters are accumulated in memory and written once per batch,
+    or once every `flush_every` decks when it is set.
     """
-    
-    patterns = all_patterns(pattern_len)
-    pattern_bits = {p: str_to_bits(p) for p in patterns}
-    for row in batch_array:
-        deck_list = list(map(int, row))
-        for p1 in patterns:
-            for p2 in patterns:
-                if p1 == p2: continue
-                p1_c, p1_cw, p1_t, p1_tw, p2_c, p2_cw, p2_t, p2_tw, d_c, d_t = play_through_deck(deck_list, pattern_bits[p1], pattern_bits[p2])
-                update_aggregate_db(db_conn, p1, p2, p1_c, p1_cw, p1_t, p1_tw, p2_c, p2_cw, p2_t, p2_tw, d_c, d_t)
\ No newline at end of file
+
+    step = flush_every or max(len(batch_array), 1)
+    chunks = (batch_array[start:start + step] for start in range(0, len(batch_array), step))
+    process_deck_stream(chunks, db_conn, pattern_len, workers)
@@ -1,16 +1,16 @@
 import os
-import random
 import sqlite3
 import sys
 import time
 from typing import List
 import numpy as np
-import psutil
 
 # --- My Imports ---
-from src.db_generation import Deck, get_next_seed
-from src.db_helpers import debugger, string_to_binary
-from src.config import DB_PATH, BATCH_SIZE, DATA_UNSCORED_FOLDER
+from src.db_generation import Deck, deck_rng, generate_batches, get_next_seed
+from src.db_helpers import debugger, save_decks, string_to_binary
+from src.ledger import open_ledger, register_files
+from src.metrics import peak_rss_mb
+from src.config import DB_PATH, BATCH_SIZE, DATA_UNSCORED_FOLDER, GENERATION_WORKERS
 
 
 def setup_database() -> None:
@@ -41,7 +41,7 @@ def check_length() -> int:
 def insert_decks(num_to_add: int) -> None:
     """
     Generates and inserts new decks, incrementing
-    random seed for each batch of 10,000 decks.
+    the seed (and so the random stream) for each batch of 10,000 decks.
     """
     print(f"[START] Generating {num_to_add} decks in {num_to_add // BATCH_SIZE} batches ...")
     start_seed = get_next_seed()
@@ -60,8 +60,8 @@ def insert_decks(num_to_add: int) -> None:
                 break
             #print(f"  -> Generating batch of {num_this_batch} decks with seed {current_seed}...")
             
-            random.seed(current_seed)
-            decks_to_insert = [(Deck().get_sequence_string(),) for _ in range(num_this_batch)]
+            rng = deck_rng(current_seed)
+            decks_to_insert = [(Deck(rng=rng).get_sequence_string(),) for _ in range(num_this_batch)]
             cursor.executemany("INSERT INTO decks (sequence) VALUES (?)", decks_to_insert)
             conn.commit()
 
@@ -72,16 +72,47 @@ def insert_decks(num_to_add: int) -> None:
             n_files += 1
     
     elapsed = time.time() - start_time
-    process = psutil.Process(os.getpid())
-    rss_mb = process.memory_info().rss / (1024 ** 2)
 
     print("\n[SUMMARY]")
     print(f" Total decks generated: {total_saved}")
     print(f" Number of files: {n_files}")
     print(f" Runtime: {elapsed:.2f} seconds")
-    print(f" Peak memory usage (RSS): {rss_mb:.2f} MB")
+    print(f" Peak memory usage (RSS): {peak_rss_mb():.2f} MB")
     print(f"Successfully generated {decks_generated} decks.\n")
 
+def generate_decks(num_to_add: int, out_folder: str = DATA_UNSCORED_FOLDER,
+                   workers: int = GENERATION_WORKERS) -> List[str]:
+    """
+    Generates decks straight to .npy files, one file of up to BATCH_SIZE
+    decks per seed, without going through the decks database.
+    With workers > 1 batches are generated in parallel; the files are the same either way.
+    Each file is recorded in the ledger as soon as it is written.
+    Returns the paths of the files written.
+    """
+    print(f"[START] Generating {num_to_add} decks in {-(-num_to_add // BATCH_SIZE)} batches ...")
+    decks_generated = 0
+    start_time = time.time()
+    paths = []
+    ledger = open_ledger()
+
+    for seed, decks in generate_batches(get_next_seed(), num_to_add, BATCH_SIZE, workers):
+        path = os.path.join(out_folder, f"decks_{len(decks)}_seed{seed}.npy")
+        save_decks(path, decks)
+        register_files(ledger, [path])
+        paths.append(path)
+        decks_generated += len(decks)
+    ledger.close()
+
+    elapsed = time.time() - start_time
+
+    print("\n[SUMMARY]")
+    print(f" Total decks generated: {decks_generated}")
+    print(f" Number of files: {len(paths)}")
+    print(f" Runtime: {elapsed:.2f} seconds")
+    print(f" Peak memory usage (RSS): {peak_rss_mb():.2f} MB")
+    print(f"Successfully generated {decks_generated} decks.\n")
+    return paths
+
 def export_decks_and_clear_db(batch_size: int = BATCH_SIZE) -> None:
     """
     Exports decks from the database, clears the table, and then deletes the .db file
@@ -0,0 +1,129 @@
+from functools import lru_cache
+from math import comb
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+import numpy as np
+
+from . import automaton
+from .artifacts import load_artifact
+from .automaton import pair_automaton
+from .batch_logic import TALLY_FIELDS
+from .game_logic import pattern_pairs
+from .config import CACHE_DIR, DEFAULT_COMPOSITION, PATTERN_LEN
+from .results_store import tensor_to_frame
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+@lru_cache(maxsize=None)
+def exact_outcomes(p1: str, p2: str, reds: int, blacks: int, metric: str) -> Tuple[int, int, int, int, int]:
+    """
+    Exact dynamic-programming solution of one pattern pair under one scoring rule.
+    Every distinct arrangement of `reds` R (1) and `blacks` B (0) cards is counted once,
+    by walking the deck card by card over the states
+    (reds drawn, pair automaton state, cards since the last trick, p1 - p2 score).
+    Returns (p1 total, p2 total, p1 wins, p2 wins, draws), each summed over all
+    comb(reds + blacks, reds) arrangements.
+    """
+    if metric not in ('tricks', 'cards'):
+        raise ValueError('metric must be either "tricks" or "cards"')
+    transitions, owner = pair_automaton(p1, p2)
+    # terminal states move like the empty prefix, so a trick sends the walk back to state 0
+    n_live = len(owner) - 2
+    signs = {1: 1, 2: -1}
+    deck_len = reds + blacks
+    track_pending = metric == 'cards'
+    n_pending = deck_len + 1 if track_pending else 1
+    offset = deck_len
+    # arrangement counts fit in int64 for any deck that fits a packed word
+    dtype = np.int64 if comb(deck_len, reds) < 2 ** 62 else object
+
+    # state[automaton state][reds drawn, cards since last trick, score difference + offset]
+    state = np.zeros((n_live, reds + 1, n_pending, 2 * deck_len + 1), dtype=dtype)
+    state[0, 0, 0, offset] = 1
+    new_state = np.zeros_like(state)
+    totals = {1: 0, -1: 0}
+
+    for t in range(deck_len):
+        # the two buffers alternate; stale entries from step t - 1 all lie in the block cleared here
+        new_state[:, :, :t + 2, offset - t - 1:offset + t + 2] = 0
+        # number of ways to finish the deck after this card, by reds drawn so far
+        completions = np.array([comb(deck_len - t - 1, reds - r) if reds - r <= deck_len - t - 1 else 0
+                                for r in range(reds + 1)], dtype=dtype)
+        # after t cards, |score| + cards since last trick <= t, so only this block can be occupied
+        band = slice(offset - t, offset + t + 1)
+        n_occupied = min(t, n_pending - 1) + 1
+        for automaton_state in range(n_live):
+            src = state[automaton_state, :, :n_occupied, band]
+            # drawing R moves row r to r + 1; drawing B keeps r, which needs t - r < blacks
+            for card, src_rows, dst_rows in ((1, slice(None, -1), slice(1, None)),
+                                             (0, slice(max(0, t - blacks + 1), None), slice(max(0, t - blacks + 1), None))):
+                moved = src[src_rows]
+                next_state = int(transitions[(automaton_state << 1) | card])
+                if owner[next_state]:
+                    sign = signs[int(owner[next_state])]
+                    for pending in range(n_occupied):
+                        span = t - pending
+                        part = moved[:, pending, pending:pending + 2 * span + 1]
+                        gain = pending + 1 if track_pending else 1
+                        totals[sign] += gain * int(part.sum(axis=1) @ completions[dst_rows])
+                        lo = offset - span + sign * gain
+                        new_state[0, dst_rows, 0, lo:lo + 2 * span + 1] += part
+                elif track_pending:
+                    new_state[next_state, dst_rows, 1:n_occupied + 1, band] += moved
+                else:
+                    new_state[next_state, dst_rows, :, band] += moved
+        state, new_state = new_state, state
+
+    final = state.sum(axis=(0, 1, 2))
+    p1_wins = int(final[offset + 1:].sum())
+    p2_wins = int(final[:offset].sum())
+    draws = int(final[offset])
+    return totals[1], totals[-1], p1_wins, p2_wins, draws
+
+def exact_pair_tally(p1: str, p2: str, composition: Optional[Dict[str, int]] = None) -> np.ndarray:
+    """
+    Exact counters for one ordered pair, in TALLY_FIELDS order, as if every distinct
+    deck of the composition had been scored exactly once.
+    """
+    if composition is None:
+        composition = DEFAULT_COMPOSITION
+    reds, blacks = composition.get('R', 0), composition.get('B', 0)
+    p1_c, p2_c, p1_cw, p2_cw, d_c = exact_outcomes(p1, p2, reds, blacks, 'cards')
+    p1_t, p2_t, p1_tw, p2_tw, d_t = exact_outcomes(p1, p2, reds, blacks, 'tricks')
+    return np.array([p1_c, p1_cw, p1_t, p1_tw, p2_c, p2_cw, p2_t, p2_tw, d_c, d_t,
+                     comb(reds + blacks, reds)], dtype=object)
+
+def exact_scores(pattern_len: int = PATTERN_LEN, composition: Optional[Dict[str, int]] = None,
+                 cache_dir: Optional[str] = CACHE_DIR) -> 'pd.DataFrame':
+    """
+    Exact scores table for every ordered pattern pair, in the same layout as scoring_results.csv.
+    (p2, p1) is the mirror image of (p1, p2), so each unordered pair is solved once.
+    Solutions are kept in the artifact cache per pattern length and composition,
+    whenever the counters fit in int64.
+    """
+    if composition is None:
+        composition = DEFAULT_COMPOSITION
+    reds, blacks = composition.get('R', 0), composition.get('B', 0)
+
+    def build() -> Dict[str, np.ndarray]:
+        rows = {}
+        for p1, p2 in pattern_pairs(pattern_len):
+            if (p2, p1) in rows:
+                p1_c, p1_cw, p1_t, p1_tw, p2_c, p2_cw, p2_t, p2_tw, d_c, d_t, games = rows[(p2, p1)]
+                rows[(p1, p2)] = [p2_c, p2_cw, p2_t, p2_tw, p1_c, p1_cw, p1_t, p1_tw, d_c, d_t, games]
+            else:
+                rows[(p1, p2)] = list(exact_pair_tally(p1, p2, composition))
+        n = 2 ** pattern_len
+        tensor = np.zeros((n, n, len(TALLY_FIELDS)), dtype=object)
+        for (p1, p2), counts in rows.items():
+            tensor[int(p1, 2), int(p2, 2)] = counts
+        return {'tallies': tensor}
+
+    # card totals are at most deck_len per arrangement
+    if comb(reds + blacks, reds) * (reds + blacks) < 2 ** 63:
+        key = {'len': pattern_len, 'R': reds, 'B': blacks}
+        tensor = load_artifact('exact', key, lambda: {'tallies': build()['tallies'].astype(np.int64)},
+                               (__file__, automaton.__file__), cache_dir)['tallies']
+    else:
+        tensor = build()['tallies']
+    return tensor_to_frame(tensor)
@@ -0,0 +1,94 @@
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from .batch_logic import tally_parallel
+from .config import (BATCH_SIZE, DATA_SCORED_FOLDER, FUSED_QUEUE_SIZE, GENERATION_WORKERS, KEEP_DECKS,
+                     PATTERN_LEN, SCORES_DB, SCORING_WORKERS)
+from .db_generation import generate_batches, get_next_seed
+from .db_helpers import save_decks
+from .db_processing import Checkpointer, flush_tallies
+from .game_logic import pattern_pairs
+from .ledger import record_scored_batch
+
+def _put(batches: queue.Queue, item, stop: threading.Event) -> bool:
+    """
+    Puts an item on the queue, giving up once `stop` is set. Returns whether it was queued.
+    """
+    while not stop.is_set():
+        try:
+            batches.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _produce(batches: queue.Queue, stop: threading.Event, first_seed: int, n: int, batch_size: int,
+             workers: int = GENERATION_WORKERS):
+    """
+    Generates batches of decks by consecutive seeds (on `workers` processes) and queues
+    (seed, decks), then None; an exception is queued in place of the rest.
+    """
+    stream = generate_batches(first_seed, n, batch_size, workers)
+    try:
+        for item in stream:
+            if not _put(batches, item, stop):
+                return
+        _put(batches, None, stop)
+    except BaseException as e:
+        _put(batches, e, stop)
+    finally:
+        stream.close()
+
+def generate_and_score(conn: sqlite3.Connection, n: int, pattern_len: int = PATTERN_LEN,
+                       batch_size: int = BATCH_SIZE, workers: int = SCORING_WORKERS,
+                       keep_decks: bool = KEEP_DECKS, out_folder: str = DATA_SCORED_FOLDER,
+                       pairs: Optional[List[Tuple[str, str]]] = None, queue_size: int = FUSED_QUEUE_SIZE,
+                       ledger_path: str = SCORES_DB, checkpointer: Optional[Checkpointer] = None,
+                       generation_workers: int = GENERATION_WORKERS) -> int:
+    """
+    Fused pipeline: a producer thread generates batches of decks into a bounded queue, on
+    `generation_workers` processes when above 1, while this thread scores each one straight
+    into the scores table, for every pattern pair or only `pairs`.
+    Each batch's counters and its ledger entry, which marks the seed as the position in the
+    stream, are written together and committed by `checkpointer` every few seconds or decks,
+    so a restart continues after the last committed seed. With keep_decks the decks are also
+    saved to `out_folder`, otherwise only the tallies (and the seed) are kept.
+    Returns the number of decks scored.
+    """
+    if pairs is None:
+        pairs = pattern_pairs(pattern_len)
+    if keep_decks:
+        os.makedirs(out_folder, exist_ok=True)
+    if checkpointer is None:
+        checkpointer = Checkpointer(conn)
+    batches = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    producer = threading.Thread(target=_produce, daemon=True,
+                                args=(batches, stop, get_next_seed(ledger_path=ledger_path), n, batch_size, generation_workers))
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    n_scored = 0
+    producer.start()
+    try:
+        while (item := batches.get()) is not None:
+            if isinstance(item, BaseException):
+                raise item
+            seed, decks = item
+            path = ''
+            if keep_decks:
+                path = os.path.join(out_folder, f"decks_{len(decks)}_seed{seed}.npy")
+                save_decks(path, decks)
+            flush_tallies(conn, pairs, tally_parallel(decks, pattern_len, workers, executor, pairs=pairs))
+            record_scored_batch(conn, seed, len(decks), path)
+            checkpointer.advance(len(decks))
+            n_scored += len(decks)
+        checkpointer.commit()
+    finally:
+        stop.set()
+        producer.join()
+        if executor is not None:
+            executor.shutdown()
+    return n_scored
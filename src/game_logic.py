@@ -1,9 +1,23 @@
+from functools import lru_cache
 from itertools import product
-from typing import List
+from typing import List, Tuple
+
+@lru_cache(maxsize=None)
+def _patterns(length: int) -> Tuple[str, ...]:
+    return tuple(''.join(bits) for bits in product('01', repeat=length))
+
+@lru_cache(maxsize=None)
+def _pairs(length: int) -> Tuple[Tuple[str, str], ...]:
+    patterns = _patterns(length)
+    return tuple((p1, p2) for p1 in patterns for p2 in patterns if p1 != p2)
 
 def all_patterns(length: int) -> List[str]:
     """Return list of all binary patterns as strings e.g. '000'."""
-    return [''.join(bits) for bits in product('01', repeat=length)]
+    return list(_patterns(length))
+
+def pattern_pairs(length: int) -> List[Tuple[str, str]]:
+    """Return every ordered pair of distinct patterns, in scores table order."""
+    return list(_pairs(length))
 
 def str_to_bits(s: str) -> List[int]:
     """Convert a binary string to a list of integers."""
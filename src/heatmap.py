@@ -1,17 +1,21 @@
 import os
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
+from matplotlib.collections import PatchCollection
 
 from src.game_logic import all_patterns
-from src.db_generation import Deck, get_next_seed
-from src.db_processing import init_temp_db, process_single_batch_array_db, export_db_to_csv
+from src.db_generation import generate_deck_batch, get_next_seed
+from src.db_helpers import save_decks
+from src.exact_solver import exact_scores
+from src.metrics import count
+from src.db_processing import export_db_to_csv
+from src.ledger import open_ledger, register_files, score_pending
+from src.results_store import load_snapshot, save_snapshot, snapshot_paths, tensor_to_frame
 from src.config import *
 
-os.makedirs(FIGURES_DIR, exist_ok = True)
-
 def load_scores(csv_path: str = RESULTS_CSV) -> pd.DataFrame:
     '''
     Load precomputed scoring results CSV into pandas DataFrame.
@@ -19,6 +23,7 @@ def load_scores(csv_path: str = RESULTS_CSV) -> pd.DataFrame:
     if not os.path.exists(csv_path):
         raise FileNotFoundError(f"Results CSV not found at {csv_path}. Please run scoring first.")
     df = pd.read_csv(csv_path, dtype={'p1': str, 'p2': str})
+    count('bytes_read', os.path.getsize(csv_path))
     print(f"[load_scores] Loaded {len(df)} rows from {csv_path}")
     return df
 
@@ -35,7 +40,6 @@ def make_matrix(df: pd.DataFrame, metric: str = 'tricks') -> Tuple[np.ndarray, n
     '''
     patterns = patterns_ordered()
     n = len(patterns)
-    idx = {pat: i for i, pat in enumerate(patterns)}
     
     win_matrix = np.zeros((n, n), dtype=int)
     draw_matrix = np.zeros((n, n), dtype=int)
@@ -51,79 +55,111 @@ def make_matrix(df: pd.DataFrame, metric: str = 'tricks') -> Tuple[np.ndarray, n
     else:
         raise ValueError('metric must be either "tricks" or "cards"')
 
-    for _, row in df.iterrows():
-        p1 = row['p1']
-        p2 = row['p2']
-        if p1 not in idx or p2 not in idx:
-            continue
-        i = idx[p2]  # vertical axis = opponent choice
-        j = idx[p1]  # horizontal axis = my choice
+    # rows for other pattern lengths are ignored; patterns are indexed by their binary value
+    df = df[(df['p1'].str.len() == PATTERN_LEN) & (df['p2'].str.len() == PATTERN_LEN)]
+    i = np.array([int(p, 2) for p in df['p2']], dtype=int)  # vertical axis = opponent choice
+    j = np.array([int(p, 2) for p in df['p1']], dtype=int)  # horizontal axis = my choice
 
-        a = float(row.get(p1_col, 0))
-        b = float(row.get(p2_col, 0))
-        d = float(row.get(draw_col, 0))
-        total = a + b + d
+    a, b, d = (df[col].to_numpy(dtype=float) if col in df.columns else np.zeros(len(df))
+               for col in (p1_col, p2_col, draw_col))
+    total = a + b + d
+    safe_total = np.where(total > 0, total, 1)
 
-        win_matrix[i, j] = int(round(100 * (a / total))) if total > 0 else 0
-        draw_matrix[i, j] = int(round(100 * (d / total))) if total > 0 else 0
+    win_matrix[i, j] = np.where(total > 0, np.rint(100 * (a / safe_total)), 0)
+    draw_matrix[i, j] = np.where(total > 0, np.rint(100 * (d / safe_total)), 0)
 
     return win_matrix, draw_matrix
 
-def plot_heatmap(win_matrix: np.ndarray, draw_matrix: np.ndarray, patterns: List[str],
-                 title: str, out_path: str):
+def plot_heatmaps(panels: List[Tuple[np.ndarray, np.ndarray, str, str]], patterns: List[str],
+                  annotate: Optional[bool] = None):
     '''
-    Plot a heatmap with annotations "win(draw)" in integer percents.
+    Plot one heatmap per (win_matrix, draw_matrix, title, out_path) panel, with annotations
+    "win(draw)" in integer percents. The figure, axes, ticks and text artists are built once
+    and only their data is swapped between panels.
+    annotate=None annotates cells only up to HEATMAP_ANNOTATE_MAX patterns.
     '''
     n = len(patterns)
-    fig, ax = plt.subplots(figsize=(max(6, n), max(6, n)))
-    im = ax.imshow(win_matrix, origin='upper', vmin=0, vmax=100, cmap='Blues')
+    if annotate is None:
+        annotate = n <= HEATMAP_ANNOTATE_MAX
+    fig, ax = plt.subplots(figsize=(max(6, n), max(6, n)) if annotate else (8, 8))
+    im = ax.imshow(panels[0][0], origin='upper', vmin=0, vmax=100, cmap='Blues')
 
+    labelsize = None if annotate else 'xx-small'
     ax.set_xticks(range(n))
-    ax.set_xticklabels(patterns, rotation=45, ha='right')
+    ax.set_xticklabels(patterns, rotation=45 if annotate else 90, ha='right' if annotate else 'center', fontsize=labelsize)
     ax.set_yticks(range(n))
-    ax.set_yticklabels(patterns)
+    ax.set_yticklabels(patterns, fontsize=labelsize)
     ax.set_xlabel('My Choice')
     ax.set_ylabel('Opponent Choice')
-    ax.set_title(title)
-
-    for i in range(n):
-        for j in range(n):
-            txt = f"{int(win_matrix[i,j])}({int(draw_matrix[i,j])})"
-            color = 'black' if win_matrix[i,j] < 50 else 'white'
-            ax.text(j, i, txt, ha='center', va='center', color=color, fontsize=8)
+    title = ax.set_title(panels[0][2])
 
-    # black rectangle around best cell in each row
-    for i in range(n):
-        j_best = int(np.argmax(win_matrix[i, :]))
-        rect = patches.Rectangle((j_best - 0.5, i - 0.5), 1, 1, linewidth=2, edgecolor='black', facecolor='none')
-        ax.add_patch(rect)
+    texts = [[ax.text(j, i, '', ha='center', va='center', fontsize=8) for j in range(n)]
+             for i in range(n)] if annotate else []
 
     cbar = fig.colorbar(im, ax=ax, fraction=0.046, pad=0.04)
     cbar.set_label('Win Probability (%)')
-
     plt.tight_layout()
-    plt.savefig(out_path, dpi=200)
+
+    best = None
+    for win_matrix, draw_matrix, panel_title, out_path in panels:
+        im.set_data(win_matrix)
+        title.set_text(panel_title)
+        for i, row in enumerate(texts):
+            for j, txt in enumerate(row):
+                txt.set_text(f"{int(win_matrix[i,j])}({int(draw_matrix[i,j])})")
+                txt.set_color('black' if win_matrix[i,j] < 50 else 'white')
+
+        # black rectangle around best cell in each row, drawn as one collection
+        if best is not None:
+            best.remove()
+        j_best = np.argmax(win_matrix, axis=1)
+        best = ax.add_collection(PatchCollection([patches.Rectangle((j - 0.5, i - 0.5), 1, 1) for i, j in enumerate(j_best)],
+                                                 linewidth=2, edgecolor='black', facecolor='none'))
+
+        fig.savefig(out_path, dpi=200)
+        count('bytes_written', os.path.getsize(out_path))
     plt.close(fig)
 
-def generate_heatmaps(csv_path: str = RESULTS_CSV, out_dir: str = FIGURES_DIR):
+def plot_heatmap(win_matrix: np.ndarray, draw_matrix: np.ndarray, patterns: List[str],
+                 title: str, out_path: str, annotate: Optional[bool] = None):
+    '''
+    Plot a heatmap with annotations "win(draw)" in integer percents.
+    '''
+    plot_heatmaps([(win_matrix, draw_matrix, title, out_path)], patterns, annotate)
+
+def generate_heatmaps(csv_path: Optional[str] = None, out_dir: str = FIGURES_DIR, exact: bool = False,
+                      snapshot_dir: str = SNAPSHOT_DIR):
     '''
-    Generate both tricks and cards heatmaps from CSV scores.
+    Generate both tricks and cards heatmaps from the latest score snapshot,
+    from a scores CSV when csv_path is given (or there is no snapshot yet),
+    or from the exact solver when exact=True.
     Returns paths to saved images.
     '''
-    df = load_scores(csv_path)
+    os.makedirs(out_dir, exist_ok=True)
     patterns_binary = patterns_ordered()
     patterns_rb = [p.replace('0', 'B').replace('1', 'R') for p in patterns_binary]
-    sample_size = int(df['games_count'].max()) if 'games_count' in df.columns else 0
+    if exact:
+        df = exact_scores(PATTERN_LEN, DEFAULT_COMPOSITION)
+        subtitle, suffix = "Exact", "_exact"
+    else:
+        if csv_path is None and snapshot_paths(snapshot_dir):
+            df = tensor_to_frame(load_snapshot(snapshot_dir=snapshot_dir))
+        else:
+            df = load_scores(csv_path or RESULTS_CSV)
+        sizes = df['games_count'] if 'games_count' in df.columns else pd.Series([0])
+        # adaptive runs stop scoring converged pairs, so sample sizes can differ between cells
+        sample_size = f"{int(sizes.max())}" if sizes.min() == sizes.max() else f"{int(sizes.min())}-{int(sizes.max())}"
+        subtitle, suffix = f"Sample Size {sample_size}", ""
 
     win_tricks, draw_tricks = make_matrix(df, metric='tricks')
     win_cards, draw_cards = make_matrix(df, metric='cards')
-    tricks_title = f"Win% (Draw%) by Tricks - Sample Size {sample_size}"
-    cards_title = f"Win% (Draw%) by Cards - Sample Size {sample_size}"
-    tricks_path = os.path.join(out_dir, f"heatmap_tricks.png")
-    cards_path = os.path.join(out_dir, f"heatmap_cards.png")
+    tricks_title = f"Win% (Draw%) by Tricks - {subtitle}"
+    cards_title = f"Win% (Draw%) by Cards - {subtitle}"
+    tricks_path = os.path.join(out_dir, f"heatmap_tricks{RESULTS_TAG}{suffix}.png")
+    cards_path = os.path.join(out_dir, f"heatmap_cards{RESULTS_TAG}{suffix}.png")
 
-    plot_heatmap(win_tricks, draw_tricks, patterns_rb, tricks_title, tricks_path)
-    plot_heatmap(win_cards, draw_cards, patterns_rb, cards_title, cards_path)
+    plot_heatmaps([(win_tricks, draw_tricks, tricks_title, tricks_path),
+                   (win_cards, draw_cards, cards_title, cards_path)], patterns_rb)
 
     print(f"[generate_heatmaps] Saved heatmaps:\n - {tricks_path}\n - {cards_path}")
     return tricks_path, cards_path
@@ -134,18 +170,16 @@ def heatmap_augment_data(n: int):
     automatically update all scores and figures 
     '''
     seed = get_next_seed()
-    np.random.seed(seed)
-    decks = np.zeros((n, DECK_LEN), dtype = int)
-
-    for i in range(n):
-        deck = Deck()
-        decks[i] = [1 if c == 'R' else 0 for c in deck.cards]
+    decks = generate_deck_batch(seed, n)
 
     batch_path = os.path.join(DATA_SCORED_FOLDER, f'decks_{n}_seed{seed}.npy')
-    np.save(batch_path, decks)
-
-    conn = init_temp_db(DB_PATH, pattern_len = PATTERN_LEN, seed_csv_path = RESULTS_CSV)
-    process_single_batch_array_db(decks, conn, pattern_len = PATTERN_LEN)
-    export_db_to_csv(conn, RESULTS_CSV)
+    save_decks(batch_path, decks)
+
+    conn = open_ledger(SCORES_DB, pattern_len = PATTERN_LEN, seed_csv_path = RESULTS_CSV)
+    register_files(conn, [batch_path])
+    n_scored = score_pending(conn, pattern_len = PATTERN_LEN)
+    save_snapshot(conn, n_scored, pattern_len = PATTERN_LEN)
+    if EXPORT_CSV:
+        export_db_to_csv(conn, RESULTS_CSV)
     conn.close()
-    generate_heatmaps(RESULTS_CSV)
\ No newline at end of file
+    generate_heatmaps()
\ No newline at end of file
@@ -0,0 +1,56 @@
+from typing import List, Mapping, Tuple
+import numpy as np
+
+from .config import CI_Z
+
+# Win counters shown in the heatmaps; each gets a (lo, hi) Wilson interval in the results CSV
+INTERVAL_COUNTS = ('p1_tricks_wins', 'p1_cards_wins')
+INTERVAL_FIELDS = tuple(f"{col}_{end}" for col in INTERVAL_COUNTS for end in ('lo', 'hi'))
+
+def wilson_interval(successes: np.ndarray, trials: np.ndarray, z: float = CI_Z) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Wilson score interval for a binomial proportion, elementwise.
+    Pairs with no trials get the uninformative interval [0, 1].
+    """
+    successes = np.asarray(successes, dtype=float)
+    trials = np.asarray(trials, dtype=float)
+    n = np.maximum(trials, 1)
+    p = successes / n
+    denom = 1 + z ** 2 / n
+    center = (p + z ** 2 / (2 * n)) / denom
+    half = z / denom * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2))
+    empty = trials == 0
+    return np.where(empty, 0.0, center - half), np.where(empty, 1.0, center + half)
+
+def interval_half_widths(table: Mapping[str, np.ndarray], z: float = CI_Z) -> np.ndarray:
+    """
+    Largest interval half-width over the heatmap win proportions, one value per row of a scores table
+    (a DataFrame or a dict of columns).
+    """
+    widths = [np.subtract(*wilson_interval(table[col], table['games_count'], z)[::-1]) / 2 for col in INTERVAL_COUNTS]
+    return np.max(widths, axis=0)
+
+def add_intervals(columns: List[str], rows: List[tuple], z: float = CI_Z) -> Tuple[List[str], List[tuple]]:
+    """
+    Returns the columns and rows of a scores table with a Wilson interval
+    next to each heatmap win counter.
+    """
+    keep = [k for k, col in enumerate(columns) if col not in INTERVAL_FIELDS]
+    columns = [columns[k] for k in keep]
+    rows = [tuple(row[k] for k in keep) for row in rows]
+    table = {col: np.array([row[k] for row in rows]) for k, col in enumerate(columns) if col in INTERVAL_COUNTS + ('games_count',)}
+    bounds = {}
+    for col in INTERVAL_COUNTS:
+        lo, hi = wilson_interval(table[col], table['games_count'], z)
+        bounds[f"{col}_lo"], bounds[f"{col}_hi"] = lo.round(6).tolist(), hi.round(6).tolist()
+    out_columns = []
+    for col in columns:
+        out_columns.append(col)
+        if col in INTERVAL_COUNTS:
+            out_columns += [f"{col}_lo", f"{col}_hi"]
+    out_rows = []
+    for k, row in enumerate(rows):
+        values = dict(zip(columns, row))
+        values.update({field: bound[k] for field, bound in bounds.items()})
+        out_rows.append(tuple(values[col] for col in out_columns))
+    return out_columns, out_rows
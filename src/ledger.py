@@ -0,0 +1,198 @@
+import hashlib
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+
+from .config import (DATA_SCORED_FOLDER, DATA_UNSCORED_FOLDER, PATTERN_LEN, PREFETCH_CHUNKS, RESULTS_CSV,
+                     SCORE_CHUNK_SIZE, SCORES_DB, SCORING_WORKERS)
+from .db_helpers import prefetch_deck_chunks
+from .db_processing import Checkpointer, init_temp_db, process_deck_stream
+from .metrics import count
+
+DECK_FILE_PATTERN = re.compile(r'^decks_(\d+)_seed(\d+)\.npy$')
+
+def file_digest(path: str) -> str:
+    """
+    Returns the sha256 hex digest of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def deck_files(folder: str) -> List[Tuple[int, str]]:
+    """
+    Lists (seed, path) for every deck file in a folder, ordered by seed.
+    """
+    if not os.path.isdir(folder):
+        return []
+    files = []
+    for filename in os.listdir(folder):
+        match = DECK_FILE_PATTERN.match(filename)
+        if match:
+            files.append((int(match.group(2)), os.path.join(folder, filename)))
+    return sorted(files)
+
+def register_files(conn: sqlite3.Connection, paths: Iterable[str], status: str = 'generated') -> None:
+    """
+    Records deck files in the ledger by seed, with their deck count and digest.
+    Seeds already in the ledger are left untouched. A file found under a known seed at another
+    path than the recorded one is checked against the recorded digest, and a warning is printed
+    when it differs, since those decks are never scored.
+    """
+    known = {seed: (known_path, digest) for seed, known_path, digest in conn.execute("SELECT seed, path, sha256 FROM ledger")}
+    rows = []
+    for path in paths:
+        match = DECK_FILE_PATTERN.match(os.path.basename(path))
+        if not match:
+            continue
+        seed = int(match.group(2))
+        if seed in known:
+            known_path, digest = known[seed]
+            if os.path.abspath(path) != os.path.abspath(known_path) and file_digest(path) != digest:
+                print(f"Warning: deck file '{path}' differs from the file recorded for seed {seed}"
+                      f" ('{known_path or 'not kept'}'). Skipping.")
+            continue
+        rows.append((seed, path, len(np.load(path, mmap_mode='r')), file_digest(path), status))
+    conn.executemany("INSERT INTO ledger (seed, path, n_decks, sha256, status) VALUES (?,?,?,?,?)", rows)
+    conn.commit()
+    count('sql_statements', 1 + len(rows))
+
+def record_scored_batch(conn: sqlite3.Connection, seed: int, n_decks: int, path: str = '') -> None:
+    """
+    Records a batch that was scored as soon as it was generated, without committing,
+    so the caller can commit it together with its counters. `path` is empty when the
+    decks were not written to disk; the seed is recorded either way so it is never reused.
+    """
+    digest = file_digest(path) if path else ''
+    conn.execute("INSERT INTO ledger (seed, path, n_decks, sha256, status) VALUES (?,?,?,?,'scored')",
+                 (seed, path, n_decks, digest))
+    count('sql_statements')
+
+def open_ledger(db_path: str = SCORES_DB, pattern_len: int = PATTERN_LEN,
+                seed_csv_path: str = RESULTS_CSV) -> sqlite3.Connection:
+    """
+    Opens the persistent scores database holding the cumulative scores table
+    and the ledger of deck files by seed.
+    When the database has no scores table yet, it is seeded from the results CSV, and deck files
+    already in the scored folder are recorded as folded into it.
+    """
+    from_csv = os.path.exists(seed_csv_path)
+    conn = sqlite3.connect(db_path)
+    # the file may already hold other tables (e.g. a tournament) without the scores table
+    is_new = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'scores'").fetchone() is None
+    if is_new:
+        conn.close()
+        conn = init_temp_db(db_path, pattern_len, seed_csv_path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ledger (
+            seed INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            n_decks INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            status TEXT NOT NULL,
+            decks_done INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    if 'decks_done' not in {row[1] for row in conn.execute("PRAGMA table_info(ledger)")}:
+        # ledgers written before checkpointing: files were only ever scored whole
+        conn.execute("ALTER TABLE ledger ADD COLUMN decks_done INTEGER NOT NULL DEFAULT 0")
+    conn.commit()
+    if is_new and from_csv:
+        register_files(conn, [path for _, path in deck_files(DATA_SCORED_FOLDER)], status='scored')
+    return conn
+
+def ledger_max_seed(db_path: str = SCORES_DB) -> Optional[int]:
+    """
+    Returns the highest seed recorded in the ledger, or None when there is no ledger yet.
+    """
+    if not os.path.exists(db_path):
+        return None
+    with sqlite3.connect(db_path) as conn:
+        try:
+            return conn.execute("SELECT MAX(seed) FROM ledger").fetchone()[0]
+        except sqlite3.OperationalError:
+            return None
+
+def _move_scored(conn: sqlite3.Connection, seed: int, path: str, scored_folder: str) -> Callable[[], None]:
+    """
+    Returns an action moving a scored file to `scored_folder` and recording its new path,
+    to run once the file's counters are committed.
+    """
+    def move():
+        destination = os.path.join(scored_folder, os.path.basename(path))
+        if os.path.abspath(path) != os.path.abspath(destination):
+            os.replace(path, destination)
+            conn.execute("UPDATE ledger SET path = ? WHERE seed = ?", (destination, seed))
+            conn.commit()
+            count('sql_statements')
+    return move
+
+def score_pending(conn: sqlite3.Connection, pattern_len: int = PATTERN_LEN, chunk_size: int = SCORE_CHUNK_SIZE,
+                  workers: int = SCORING_WORKERS, scored_folder: str = DATA_SCORED_FOLDER,
+                  pairs: Optional[List[Tuple[str, str]]] = None,
+                  checkpointer: Optional[Checkpointer] = None, prefetch: int = PREFETCH_CHUNKS,
+                  unscored_folder: str = DATA_UNSCORED_FOLDER) -> int:
+    """
+    Folds every deck file not yet in the totals, from `unscored_folder` or `scored_folder`,
+    into the scores table, for every pattern pair or only for `pairs`.
+    After each chunk the ledger records how many decks of the file are done, in the same
+    transaction as the counters, and `checkpointer` commits every few seconds or decks.
+    An interrupted run can simply be restarted: it rolls back to the last checkpoint and
+    resumes each file from there, so no deck is counted twice or lost.
+    Scored files are moved to `scored_folder` for tidiness once committed.
+    The next `prefetch` chunks are read on background threads while one is being scored.
+    Returns the number of decks scored.
+    """
+    on_disk = deck_files(unscored_folder) + deck_files(scored_folder)
+    register_files(conn, [path for _, path in on_disk])
+    pending = []
+    for seed, path, decks_done in conn.execute(
+            "SELECT seed, path, decks_done FROM ledger WHERE status = 'generated' ORDER BY seed").fetchall():
+        if os.path.exists(path):
+            pending.append((seed, path, decks_done))
+        else:
+            print(f"Warning: deck file for seed {seed} not found at '{path}'. Skipping.")
+    if checkpointer is None:
+        checkpointer = Checkpointer(conn)
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    chunks = prefetch_deck_chunks([(path, decks_done) for _, path, decks_done in pending], chunk_size, prefetch)
+    head = None
+
+    def file_chunks(k: int) -> Iterator[np.ndarray]:
+        # the chunks of the k-th pending file; a finished file has none
+        nonlocal head
+        while head is not None and head[0] == k:
+            chunk = head[1]
+            head = next(chunks, None)
+            yield chunk
+
+    n_scored = 0
+    try:
+        head = next(chunks, None)
+        for k, (seed, path, decks_done) in enumerate(pending):
+            if decks_done:
+                print(f"Resuming seed {seed} after {decks_done} decks.")
+
+            def on_chunk(n_decks: int, seed: int = seed):
+                conn.execute("UPDATE ledger SET decks_done = decks_done + ? WHERE seed = ?", (n_decks, seed))
+                count('sql_statements')
+                checkpointer.advance(n_decks)
+
+            n_scored += process_deck_stream(file_chunks(k), conn, pattern_len,
+                                            workers, executor, pairs, on_chunk=on_chunk)
+            conn.execute("UPDATE ledger SET status = 'scored', updated_at = CURRENT_TIMESTAMP WHERE seed = ?", (seed,))
+            count('sql_statements')
+            checkpointer.on_commit.append(_move_scored(conn, seed, path, scored_folder))
+        checkpointer.commit()
+    finally:
+        chunks.close()
+        if executor is not None:
+            executor.shutdown()
+    return n_scored
@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+import psutil
+
+from .config import METRICS_FILE
+
+logger = logging.getLogger(__name__)
+
+# Process-wide counters; stages report how much each one grew while they ran
+COUNTERS: Dict[str, int] = {'sql_statements': 0, 'bytes_read': 0, 'bytes_written': 0, 'checkpoints': 0}
+
+def count(name: str, value: int = 1) -> None:
+    """
+    Adds `value` to a process-wide counter.
+    """
+    COUNTERS[name] = COUNTERS.get(name, 0) + value
+
+def rss_mb() -> float:
+    """
+    Returns the resident set size of the current process in MB.
+    """
+    return psutil.Process(os.getpid()).memory_info().rss / (1024 ** 2)
+
+def peak_rss_mb() -> float:
+    """
+    Returns the peak resident set size of the current process so far in MB.
+    """
+    try:
+        import resource
+    except ImportError:  # Windows
+        return psutil.Process(os.getpid()).memory_info().peak_wset / (1024 ** 2)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 ** 2) if sys.platform == 'darwin' else peak / 1024
+
+def process_age() -> float:
+    """
+    Returns the seconds since this process started, i.e. its cold-start time
+    when called as the program begins its work.
+    """
+    try:
+        # Linux: start time in clock ticks since boot, field 22 of /proc/self/stat (precise to a tick)
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, AttributeError, ValueError):
+        # psutil's create_time is only precise to the second on some platforms
+        return time.time() - psutil.Process(os.getpid()).create_time()
+
+class _RssSampler(threading.Thread):
+    """
+    Samples the RSS in the background, for stages that stay below the process's earlier peak.
+    """
+    def __init__(self, interval: float = 0.01):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.max_mb = rss_mb()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.max_mb = max(self.max_mb, rss_mb())
+
+    def stop(self) -> float:
+        self._stop_event.set()
+        self.join()
+        self.max_mb = max(self.max_mb, rss_mb())
+        return self.max_mb
+
+def emit(record: dict, metrics_file: Optional[str] = METRICS_FILE) -> None:
+    """
+    Logs a metrics record as one JSON line and appends it to the metrics file, if any.
+    """
+    line = json.dumps(record)
+    logger.info(line)
+    if metrics_file:
+        with open(metrics_file, 'a') as f:
+            f.write(line + '\n')
+
+@contextmanager
+def stage(name: str, decks: int = 0, metrics_file: Optional[str] = METRICS_FILE) -> Iterator[dict]:
+    """
+    Instruments a pipeline stage: monotonic wall time, CPU time of this process, peak RSS,
+    decks processed and the growth of every counter while the stage ran.
+    Yields the record, so the stage can set record['decks'] once it knows the count.
+    The peak is exact whenever the stage raised the process's lifetime peak, and is
+    sampled every 10 ms otherwise.
+    """
+    record = {'stage': name, 'started_at': datetime.now().isoformat(timespec='milliseconds'), 'decks': decks}
+    counters_before = dict(COUNTERS)
+    lifetime_peak_before = peak_rss_mb()
+    sampler = _RssSampler()
+    sampler.start()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield record
+        record['ok'] = True
+    except BaseException:
+        record['ok'] = False
+        raise
+    finally:
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        sampled_peak = sampler.stop()
+        lifetime_peak = peak_rss_mb()
+        record.update({
+            'wall_s': round(wall, 6),
+            'cpu_s': round(cpu, 6),
+            'peak_rss_mb': round(lifetime_peak if lifetime_peak > lifetime_peak_before else sampled_peak, 2),
+            'decks_per_sec': round(record['decks'] / wall, 1) if record['decks'] and wall > 0 else None,
+        })
+        record.update({key: value - counters_before.get(key, 0) for key, value in COUNTERS.items()})
+        emit(record, metrics_file)
@@ -0,0 +1,106 @@
+import os
+import re
+import sqlite3
+from typing import TYPE_CHECKING, List, Optional, Tuple
+import numpy as np
+
+from .batch_logic import TALLY_FIELDS
+from .config import PATTERN_LEN, SNAPSHOT_DIR
+from .game_logic import all_patterns
+from .metrics import count
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+SNAPSHOT_PATTERN = re.compile(r'^scores_run(\d+)\.npy$')
+
+def scores_tensor(conn: sqlite3.Connection, pattern_len: int = PATTERN_LEN) -> np.ndarray:
+    """
+    Reads the scores table into an int64 tensor of shape (n_patterns, n_patterns, len(TALLY_FIELDS)),
+    indexed by the integer codes of p1 and p2, with zeros on the diagonal.
+    """
+    n = 2 ** pattern_len
+    tensor = np.zeros((n, n, len(TALLY_FIELDS)), dtype=np.int64)
+    rows = conn.execute(f"SELECT p1, p2, {', '.join(TALLY_FIELDS)} FROM scores").fetchall()
+    count('sql_statements')
+    for p1, p2, *counts in rows:
+        tensor[int(p1, 2), int(p2, 2)] = counts
+    return tensor
+
+def tensor_to_frame(tensor: np.ndarray) -> 'pd.DataFrame':
+    """
+    Scores table of a tensor, one row per ordered pair sorted by (p1, p2), as in scoring_results.csv.
+    """
+    import pandas as pd
+    patterns = all_patterns(int(np.log2(tensor.shape[0])))
+    p1, p2 = np.nonzero(~np.eye(len(patterns), dtype=bool))
+    df = pd.DataFrame(tensor[p1, p2], columns=list(TALLY_FIELDS))
+    df.insert(0, 'p2', [patterns[i] for i in p2])
+    df.insert(0, 'p1', [patterns[i] for i in p1])
+    return df
+
+def save_snapshot(conn: sqlite3.Connection, n_decks: int, pattern_len: int = PATTERN_LEN,
+                  snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    """
+    Appends a snapshot of the cumulative scores as a new run: the tensor is written to
+    `snapshot_dir` and the run is recorded in the runs table with the decks it added.
+    Snapshots are never overwritten, so the history of every run is kept.
+    Returns the snapshot path.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT NOT NULL,
+            n_decks INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    tensor = scores_tensor(conn, pattern_len)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    run_id = conn.execute("INSERT INTO runs (path, n_decks) VALUES ('', ?)", (n_decks,)).lastrowid
+    path = os.path.join(snapshot_dir, f"scores_run{run_id:06d}.npy")
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, tensor)
+    os.replace(tmp_path, path)
+    conn.execute("UPDATE runs SET path = ? WHERE run_id = ?", (path, run_id))
+    conn.commit()
+    count('sql_statements', 3)
+    count('bytes_written', os.path.getsize(path))
+    return path
+
+def snapshot_paths(snapshot_dir: str = SNAPSHOT_DIR) -> List[Tuple[int, str]]:
+    """
+    Lists (run_id, path) for every snapshot in a folder, oldest first.
+    """
+    if not os.path.isdir(snapshot_dir):
+        return []
+    runs = []
+    for filename in os.listdir(snapshot_dir):
+        match = SNAPSHOT_PATTERN.match(filename)
+        if match:
+            runs.append((int(match.group(1)), os.path.join(snapshot_dir, filename)))
+    return sorted(runs)
+
+def load_snapshot(path: Optional[str] = None, snapshot_dir: str = SNAPSHOT_DIR) -> np.ndarray:
+    """
+    Loads a scores tensor, by default the latest snapshot in `snapshot_dir`.
+    """
+    if path is None:
+        runs = snapshot_paths(snapshot_dir)
+        if not runs:
+            raise FileNotFoundError(f"No score snapshots found in {snapshot_dir}. Please run scoring first.")
+        path = runs[-1][1]
+    tensor = np.load(path)
+    count('bytes_read', os.path.getsize(path))
+    return tensor
+
+def load_history(snapshot_dir: str = SNAPSHOT_DIR) -> Tuple[List[int], np.ndarray]:
+    """
+    Loads every snapshot for trend analysis.
+    Returns (run ids, tensor of shape (n_runs, n_patterns, n_patterns, len(TALLY_FIELDS))).
+    """
+    runs = snapshot_paths(snapshot_dir)
+    if not runs:
+        return [], np.zeros((0,), dtype=np.int64)
+    return [run_id for run_id, _ in runs], np.stack([load_snapshot(path) for _, path in runs])
@@ -0,0 +1,204 @@
+"""
+Tournaments: every ordered pair of an arbitrary list of patterns, of any lengths, scored in one
+pass over the deck files.
+
+    python -m src.tournament 011 100 0110 1001 --decks ./data/decks/scored --out tournament.csv
+
+Deck files are tracked by seed per tournament table, so a re-run only adds decks it has not seen.
+
+Each deck is read once per tournament. For every pattern a next-hit table (where the next
+occurrence starting at or after each card is) is built once per chunk and shared by all the
+pairs the pattern plays in, and all pairs are then played together through
+batch_logic.resolve_tricks, one trick per step.
+With patterns of different lengths both players can complete a pattern on the same card
+(one pattern is a suffix of the other): such a trick is taken by neither player, its cards are
+discarded and play goes on after them. Otherwise the first pattern to be completed takes the
+trick, which for patterns of one length is exactly game_logic.play_through_deck.
+"""
+import argparse
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, List, Sequence, Tuple
+import numpy as np
+
+from .batch_logic import (MIRROR_ORDER, RESULT_FIELDS, TALLY_FIELDS, deck_length, next_hit_table, resolve_tricks,
+                          tally_parallel, unique_decks, window_codes)
+from .config import (DECK_LEN, DEDUPE_DECKS, PREFETCH_CHUNKS, SCORE_CHUNK_SIZE, SCORES_DB, SCORING_WORKERS,
+                     TOURNAMENT_CELLS, TOURNAMENT_TABLE)
+from .db_helpers import prefetch_deck_chunks
+from .db_processing import create_scores_table, export_db_to_csv, flush_tallies
+from .metrics import count
+
+def tournament_patterns(patterns: Iterable[str]) -> List[str]:
+    """
+    Checks a field of patterns ('0'/'1' strings) and drops repeats, keeping the given order.
+    """
+    field = list(dict.fromkeys(patterns))
+    for p in field:
+        if not p or set(p) - {'0', '1'}:
+            raise ValueError(f"Pattern {p!r} is not a non-empty string of 0s and 1s.")
+    if len(field) < 2:
+        raise ValueError("A tournament needs at least two distinct patterns.")
+    return field
+
+def tournament_pairs(patterns: Sequence[str]) -> List[Tuple[str, str]]:
+    """Every ordered pair of distinct patterns of a field, in the field's order."""
+    return [(p1, p2) for p1 in patterns for p2 in patterns if p1 != p2]
+
+def next_hit_tables(decks: np.ndarray, patterns: Sequence[str], deck_len: int = DECK_LEN) -> np.ndarray:
+    """
+    next_hit_table of every pattern of a field, with window codes computed once per pattern length.
+    Shape is (n_patterns, n_decks, deck_len + 1); int8 when the deck length allows it.
+    """
+    decks = np.asarray(decks)
+    dtype = np.int8 if deck_len < np.iinfo(np.int8).max else np.int16
+    tables = np.full((len(patterns), len(decks), deck_len + 1), deck_len, dtype=dtype)
+    codes: Dict[int, np.ndarray] = {}
+    for k, p in enumerate(patterns):
+        if len(p) > deck_len:
+            continue
+        if len(p) not in codes:
+            codes[len(p)] = window_codes(decks, len(p), deck_len)
+        tables[k] = next_hit_table(codes[len(p)], int(p, 2), deck_len)
+    return tables
+
+def tally_tournament(decks: np.ndarray, patterns: Sequence[str], deck_len: int = DECK_LEN,
+                     dedupe: bool = DEDUPE_DECKS, cells: int = TOURNAMENT_CELLS) -> np.ndarray:
+    """
+    Sums the results of every ordered pair of a field over a batch of decks (card rows or packed words).
+    Each unordered pair is played once and mirrored; pairs are played `cells` (pair, deck) games at a time.
+    Returns an int64 array of shape (n_pairs, len(TALLY_FIELDS)), with rows in tournament_pairs order.
+    """
+    decks = np.asarray(decks)
+    deck_len = deck_length(decks, deck_len)
+    n_decks = len(decks)
+    weights = np.ones(n_decks, dtype=np.int64)
+    if dedupe:
+        unique, counts = unique_decks(decks)
+        if len(unique) < n_decks:
+            decks, weights = unique, counts
+    tables = next_hit_tables(decks, patterns, deck_len)
+    lengths = np.array([len(p) for p in patterns], dtype=np.int64)
+
+    n = len(patterns)
+    first, second = np.triu_indices(n, k=1)
+    results = np.zeros((n, n, len(RESULT_FIELDS)), dtype=np.int64)
+    group = max(1, cells // max(len(decks), 1))
+    for start in range(0, len(first), group):
+        i, j = first[start:start + group], second[start:start + group]
+        outcomes = resolve_tricks(tables[i].reshape(-1, tables.shape[2]), tables[j].reshape(-1, tables.shape[2]),
+                                  np.repeat(lengths[i], len(decks)), np.repeat(lengths[j], len(decks)))
+        results[i, j] = np.stack([r.reshape(len(i), -1) @ weights for r in outcomes], axis=1)
+    # (p2, p1) takes the same tricks as (p1, p2) with the players swapped
+    results[second, first] = results[first, second][:, list(MIRROR_ORDER)]
+
+    rows, cols = np.nonzero(~np.eye(n, dtype=bool))
+    tallies = np.zeros((len(rows), len(TALLY_FIELDS)), dtype=np.int64)
+    tallies[:, :len(RESULT_FIELDS)] = results[rows, cols]
+    tallies[:, -1] = n_decks
+    return tallies
+
+def init_tournament(db_conn: sqlite3.Connection, patterns: Sequence[str], table: str = TOURNAMENT_TABLE) -> None:
+    """
+    Creates the tournament table, with a zero row for every ordered pair of the field, next to
+    `<table>_field` (its patterns) and `<table>_ledger` (the deck files already folded into it).
+    A table kept for another field is rebuilt from scratch, so every row always counts the same decks.
+    """
+    db_conn.execute(f"CREATE TABLE IF NOT EXISTS {table}_field (position INTEGER PRIMARY KEY, pattern TEXT NOT NULL)")
+    stored = [row[0] for row in db_conn.execute(f"SELECT pattern FROM {table}_field ORDER BY position")]
+    if stored and sorted(stored) != sorted(patterns):
+        print(f"[tournament] Field of '{table}' changed from {len(stored)} patterns: rescoring from scratch.")
+    if sorted(stored) != sorted(patterns):
+        for name in (table, f"{table}_ledger", f"{table}_field"):
+            db_conn.execute(f"DROP TABLE IF EXISTS {name}")
+        db_conn.execute(f"CREATE TABLE {table}_field (position INTEGER PRIMARY KEY, pattern TEXT NOT NULL)")
+        db_conn.executemany(f"INSERT INTO {table}_field VALUES (?, ?)", list(enumerate(patterns)))
+    db_conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table}_ledger (
+            seed INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            n_decks INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    create_scores_table(db_conn, table)
+    zeros = (0,) * len(TALLY_FIELDS)
+    pairs = tournament_pairs(patterns)
+    db_conn.executemany(f"INSERT OR IGNORE INTO {table} VALUES ({', '.join('?' * (2 + len(TALLY_FIELDS)))})",
+                        [(p1, p2, *zeros) for p1, p2 in pairs])
+    db_conn.commit()
+    count('sql_statements', 5 + len(pairs))
+
+def run_tournament(patterns: Iterable[str], files: Iterable[Tuple[int, str]], db_conn: sqlite3.Connection,
+                   table: str = TOURNAMENT_TABLE, workers: int = SCORING_WORKERS,
+                   chunk_size: int = SCORE_CHUNK_SIZE, prefetch: int = PREFETCH_CHUNKS) -> int:
+    """
+    Scores every ordered pair of a field of patterns over deck files, given as (seed, path)
+    like ledger.deck_files, in a single pass, adding the counters to `table` once per chunk.
+    Files whose seed is already in the tournament's ledger are skipped, and each file is folded
+    in and recorded in one transaction, so re-running over the same decks counts nothing twice
+    and an interrupted run can simply be restarted.
+    Returns the number of decks scored.
+    """
+    patterns = tournament_patterns(patterns)
+    pairs = tournament_pairs(patterns)
+    init_tournament(db_conn, patterns, table)
+    done = {row[0] for row in db_conn.execute(f"SELECT seed FROM {table}_ledger")}
+    # a seed seen in several folders is the same file, moved
+    pending = list({seed: (seed, path) for seed, path in files if seed not in done}.values())
+    sizes = [len(np.load(path, mmap_mode='r')) for _, path in pending]
+    remaining = list(sizes)
+    tally = partial(tally_tournament, patterns=patterns)
+
+    def record(k: int):
+        db_conn.execute(f"INSERT INTO {table}_ledger (seed, path, n_decks) VALUES (?, ?, ?)", (*pending[k], sizes[k]))
+        db_conn.commit()
+        count('sql_statements')
+
+    for k, size in enumerate(sizes):
+        if size == 0:
+            record(k)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    chunks = prefetch_deck_chunks([(path, 0) for _, path in pending], chunk_size, prefetch)
+    n_scored = 0
+    try:
+        for k, chunk in chunks:
+            flush_tallies(db_conn, pairs, tally_parallel(chunk, None, workers, executor, tally=tally), table)
+            n_scored += len(chunk)
+            remaining[k] -= len(chunk)
+            if remaining[k] == 0:
+                record(k)
+    except BaseException:
+        # drop the counters of a partly scored file
+        db_conn.rollback()
+        raise
+    finally:
+        chunks.close()
+        if executor is not None:
+            executor.shutdown()
+    return n_scored
+
+def main():
+    from .ledger import deck_files
+
+    parser = argparse.ArgumentParser(description="Score every ordered pair of a list of patterns of any lengths.")
+    parser.add_argument('patterns', nargs='+', help="patterns as strings of 0s and 1s, e.g. 011 1001")
+    parser.add_argument('--decks', nargs='+', required=True, help="folders of deck files to play")
+    parser.add_argument('--db', default=SCORES_DB, help="database the tournament table is kept in")
+    parser.add_argument('--table', default=TOURNAMENT_TABLE, help="table the counters are added to")
+    parser.add_argument('--workers', type=int, default=SCORING_WORKERS, help="scoring processes")
+    parser.add_argument('--out', help="CSV file the table is exported to")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    files = sorted(f for folder in args.decks for f in deck_files(folder))
+    n = run_tournament(args.patterns, files, conn, args.table, args.workers)
+    print(f"[tournament] {n} decks scored for {len(tournament_patterns(args.patterns))} patterns.")
+    if args.out:
+        export_db_to_csv(conn, args.out, table=args.table)
+        print(f"[tournament] Results written to {args.out}")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
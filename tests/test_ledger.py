@@ -0,0 +1,86 @@
+"""
+Checks that a scoring run killed between checkpoints resumes without losing or recounting a deck.
+"""
+import sqlite3
+import numpy as np
+import pytest
+
+from src import ledger
+from src.db_processing import Checkpointer, export_db_to_csv
+
+N_FILES, FILE_DECKS, CHUNK_SIZE = 2, 64, 8  # 16 chunks in all
+CHECKPOINT_DECKS = 3 * CHUNK_SIZE
+
+class Crash(Exception):
+    pass
+
+class CrashingCheckpointer(Checkpointer):
+    """Stops the run at the `crash_at`-th chunk, after its counters are written but before any commit."""
+    def __init__(self, db_conn: sqlite3.Connection, crash_at: int):
+        super().__init__(db_conn, every_decks=CHECKPOINT_DECKS, every_seconds=None)
+        self.chunks_left = crash_at
+
+    def advance(self, n_decks: int) -> bool:
+        self.chunks_left -= 1
+        if self.chunks_left == 0:
+            raise Crash
+        return super().advance(n_decks)
+
+def deck_folder(root) -> None:
+    unscored = root / 'unscored'
+    unscored.mkdir(parents=True)
+    (root / 'scored').mkdir()
+    rng = np.random.default_rng(5)
+    for seed in range(N_FILES):
+        decks = np.array([rng.permutation(np.repeat([1, 0], 26)) for _ in range(FILE_DECKS)], dtype=np.int8)
+        np.save(unscored / f'decks_{FILE_DECKS}_seed{seed}.npy', decks)
+
+def score(root, checkpointer) -> None:
+    # the connection is closed without committing, like a killed process
+    conn = ledger.open_ledger(str(root / 'scores.db'), 3, str(root / 'no_seed.csv'))
+    try:
+        ledger.score_pending(conn, 3, CHUNK_SIZE, 1, str(root / 'scored'), checkpointer=checkpointer(conn),
+                             unscored_folder=str(root / 'unscored'))
+    finally:
+        conn.close()
+
+def scores_csv(root) -> str:
+    conn = sqlite3.connect(root / 'scores.db')
+    export_db_to_csv(conn, str(root / 'scores.csv'))
+    conn.close()
+    return (root / 'scores.csv').read_text()
+
+def test_resume_after_crash_matches_uninterrupted_run(tmp_path):
+    whole, crashed = tmp_path / 'whole', tmp_path / 'crashed'
+    deck_folder(whole)
+    score(whole, lambda conn: Checkpointer(conn, every_decks=CHECKPOINT_DECKS, every_seconds=None))
+
+    deck_folder(crashed)
+    with pytest.raises(Crash):
+        score(crashed, lambda conn: CrashingCheckpointer(conn, crash_at=13))
+    conn = sqlite3.connect(crashed / 'scores.db')
+    # the last checkpoint came after 12 chunks, half-way through the second file
+    assert conn.execute("SELECT decks_done FROM ledger ORDER BY seed").fetchall() == [(FILE_DECKS,), (FILE_DECKS // 2,)]
+    conn.close()
+    score(crashed, lambda conn: Checkpointer(conn, every_decks=CHECKPOINT_DECKS, every_seconds=None))
+
+    assert scores_csv(crashed) == scores_csv(whole)
+    conn = sqlite3.connect(crashed / 'scores.db')
+    assert conn.execute("SELECT DISTINCT games_count FROM scores").fetchall() == [(N_FILES * FILE_DECKS,)]
+    conn.close()
+
+def test_register_files_warns_on_a_changed_copy_of_a_known_seed(tmp_path, capsys):
+    deck_folder(tmp_path)
+    conn = ledger.open_ledger(str(tmp_path / 'scores.db'), 3, str(tmp_path / 'no_seed.csv'))
+    files = [path for _, path in ledger.deck_files(str(tmp_path / 'unscored'))]
+    ledger.register_files(conn, files)
+    # the same file seen again, an identical copy and a copy with other decks
+    copies = tmp_path / 'copies'
+    copies.mkdir()
+    np.save(copies / f'decks_{FILE_DECKS}_seed0.npy', np.load(files[0]))
+    np.save(copies / f'decks_{FILE_DECKS}_seed1.npy', np.load(files[0]))
+    ledger.register_files(conn, files + [path for _, path in ledger.deck_files(str(copies))])
+    warnings = capsys.readouterr().out.splitlines()
+    assert len(warnings) == 1 and 'seed 1' in warnings[0]
+    assert conn.execute("SELECT seed, path FROM ledger ORDER BY seed").fetchall() == [(0, files[0]), (1, files[1])]
+    conn.close()
@@ -0,0 +1,89 @@
+"""
+Locks the vectorized scorers to the reference game_logic.play_through_deck.
+"""
+from functools import lru_cache, partial
+from itertools import combinations
+import numpy as np
+import pytest
+
+from src import batch_logic
+from src.batch_logic import RESULT_FIELDS, TALLY_FIELDS, score_batch, tally_batch
+from src.db_helpers import pack_decks
+from src.exact_solver import exact_pair_tally
+from src.game_logic import all_patterns, pattern_pairs, play_through_deck
+from src.tournament import tally_tournament, tournament_pairs
+
+COMPOSITIONS = {'26R26B': {'R': 26, 'B': 26}, '30R22B': {'R': 30, 'B': 22}, '4R3B': {'R': 4, 'B': 3}}
+RESOLVERS = ['blocks', 'automaton', 'next_hit']
+
+@lru_cache(maxsize=None)
+def sample_decks(composition: str = '26R26B', n: int = 40) -> np.ndarray:
+    """n shuffled decks of a composition, the same on every run (4R3B has only 35, so some repeat)."""
+    rng = np.random.default_rng(17)
+    cards = np.repeat([1, 0], [COMPOSITIONS[composition]['R'], COMPOSITIONS[composition]['B']])
+    return np.array([rng.permutation(cards) for _ in range(n)], dtype=np.int8)
+
+@lru_cache(maxsize=None)
+def reference_tally(composition: str, pattern_len: int) -> np.ndarray:
+    decks = sample_decks(composition)
+    tallies = np.zeros((len(pattern_pairs(pattern_len)), len(TALLY_FIELDS)), dtype=np.int64)
+    for row, (p1, p2) in enumerate(pattern_pairs(pattern_len)):
+        for deck in decks:
+            tallies[row, :len(RESULT_FIELDS)] += play_through_deck(deck.tolist(), p1, p2)
+    tallies[:, -1] = len(decks)
+    return tallies
+
+@pytest.mark.parametrize('resolver', RESOLVERS)
+def test_score_batch_matches_play_through_deck(resolver):
+    decks = sample_decks()
+    scores = score_batch(decks, 3, resolver=resolver)
+    for p1, p2 in pattern_pairs(3):
+        expected = np.array([play_through_deck(deck.tolist(), p1, p2) for deck in decks]).T
+        assert np.array_equal(np.array(scores[p1, p2]), expected)
+
+@pytest.mark.parametrize('composition', list(COMPOSITIONS))
+@pytest.mark.parametrize('pattern_len', [3, 4, 5])
+@pytest.mark.parametrize('resolver', RESOLVERS)
+@pytest.mark.parametrize('packed', [False, True])
+@pytest.mark.parametrize('dedupe', [False, True])
+def test_tally_batch_matches_play_through_deck(monkeypatch, composition, pattern_len, resolver, packed, dedupe):
+    monkeypatch.setattr(batch_logic, 'score_batch', partial(batch_logic.score_batch, resolver=resolver))
+    decks = sample_decks(composition)
+    got = tally_batch(pack_decks(decks) if packed else decks, pattern_len, decks.shape[1], dedupe=dedupe)
+    assert np.array_equal(got, reference_tally(composition, pattern_len))
+
+def test_exact_pair_tally_matches_every_deck():
+    reds, blacks = 5, 4
+    n = reds + blacks
+    decks = [[1 if k in reds_at else 0 for k in range(n)] for reds_at in combinations(range(n), reds)]
+    for p1, p2 in pattern_pairs(3):
+        expected = np.sum([play_through_deck(deck, p1, p2) for deck in decks], axis=0).tolist() + [len(decks)]
+        assert exact_pair_tally(p1, p2, {'R': reds, 'B': blacks}).tolist() == expected
+
+def first_completed(deck: list, p1: str, p2: str) -> tuple:
+    """Card-by-card tournament rule: first completed pattern takes the trick, simultaneous ones discard it."""
+    cards = ''.join(map(str, deck))
+    last = 0
+    p1_cards = p2_cards = p1_tricks = p2_tricks = 0
+    for k in range(1, len(cards) + 1):
+        p1_hit, p2_hit = cards[last:k].endswith(p1), cards[last:k].endswith(p2)
+        if p1_hit and not p2_hit:
+            p1_cards, p1_tricks = p1_cards + k - last, p1_tricks + 1
+        elif p2_hit and not p1_hit:
+            p2_cards, p2_tricks = p2_cards + k - last, p2_tricks + 1
+        if p1_hit or p2_hit:
+            last = k
+    return (p1_cards, int(p1_cards > p2_cards), p1_tricks, int(p1_tricks > p2_tricks),
+            p2_cards, int(p2_cards > p1_cards), p2_tricks, int(p2_tricks > p1_tricks),
+            int(p1_cards == p2_cards), int(p1_tricks == p2_tricks))
+
+def test_tournament_one_length_matches_tally_batch():
+    assert np.array_equal(tally_tournament(sample_decks(), all_patterns(4)), reference_tally('26R26B', 4))
+
+def test_tournament_mixed_lengths():
+    decks = sample_decks('30R22B')
+    patterns = ['1', '01', '011', '11', '0110', '1001', '10101']
+    got = tally_tournament(pack_decks(decks), patterns, decks.shape[1])
+    for row, (p1, p2) in zip(got, tournament_pairs(patterns)):
+        expected = np.sum([first_completed(deck.tolist(), p1, p2) for deck in decks], axis=0).tolist() + [len(decks)]
+        assert row.tolist() == expected